@@ -0,0 +1,101 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+# returns a fen without the move counters, positions reached by different move orders share it
+def normalize_fen(fen: str):
+    return " ".join(fen.split()[:4])
+
+# engine analysis results kept on disk between games, least recently used entries are evicted past max_entries
+class AnalysisCache():
+
+    def __init__(self, path: str, max_entries: int=100000):
+        self.path = path
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS analysis (
+                                        fen TEXT NOT NULL,
+                                        engine TEXT NOT NULL,
+                                        elo INTEGER NOT NULL,
+                                        search TEXT NOT NULL,
+                                        multipv INTEGER NOT NULL,
+                                        result TEXT NOT NULL,
+                                        last_used REAL NOT NULL,
+                                        PRIMARY KEY (fen, engine, elo, search, multipv))""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS analysis_last_used ON analysis (last_used)")
+        self._connection.commit()
+
+        self._count = self._connection.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+
+        # last_used times of cache hits, written with the next put or close so a hit doesn't write to disk
+        self._used = {}
+
+    # returns the cached result of a search, None if it isn't cached
+    # search describes the search limits, example: "depth 15"
+    def get(self, fen: str, engine: str, elo: int, search: str, multipv: int):
+        key = (normalize_fen(fen), engine, elo if elo != None else 0, search, multipv)
+
+        with self._lock:
+            row = self._connection.execute("SELECT result FROM analysis WHERE fen=? AND engine=? AND elo=? AND search=? AND multipv=?", key).fetchone()
+
+            if row == None:
+                return None
+
+            self._used[key] = time.time()
+
+        return json.loads(row[0])
+
+    # writes the last_used times of cache hits, the caller holds the lock and commits
+    def _write_used(self):
+        if self._used:
+            self._connection.executemany("UPDATE analysis SET last_used=? WHERE fen=? AND engine=? AND elo=? AND search=? AND multipv=?",
+                                         [(used,) + key for key, used in self._used.items()])
+            self._used.clear()
+
+    # stores the result of a search, evicting the least recently used entries if the cache is full
+    def put(self, fen: str, engine: str, elo: int, search: str, multipv: int, result: dict):
+        key = (normalize_fen(fen), engine, elo if elo != None else 0, search, multipv)
+
+        with self._lock:
+            # eviction below goes by last_used, so it has to be up to date
+            self._write_used()
+
+            exists = self._connection.execute("SELECT 1 FROM analysis WHERE fen=? AND engine=? AND elo=? AND search=? AND multipv=?", key).fetchone()
+
+            self._connection.execute("INSERT OR REPLACE INTO analysis VALUES (?, ?, ?, ?, ?, ?, ?)", key + (json.dumps(result), time.time()))
+
+            if exists == None:
+                self._count += 1
+
+            if self._count > self.max_entries:
+                self._connection.execute("DELETE FROM analysis WHERE rowid IN (SELECT rowid FROM analysis ORDER BY last_used LIMIT ?)", (self._count - self.max_entries,))
+                self._count = self.max_entries
+
+            self._connection.commit()
+
+    # every engine of a pool shares the cache and closes it, only the first close does anything
+    def close(self):
+        with self._lock:
+            if self._connection == None:
+                return
+
+            self._write_used()
+            self._connection.commit()
+            self._connection.close()
+
+            self._connection = None
+
+# returns an analysis cache for a path relative to the program folder, None if the path is empty
+def load(path: str, max_entries: int=100000):
+    if not path:
+        return None
+
+    return AnalysisCache(os.path.join(os.path.dirname(os.path.abspath(__file__)), path.lstrip("/")), max_entries)
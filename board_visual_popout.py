@@ -22,8 +22,36 @@ except:
     import chess.svg
     import chess
 
+# Qt allows one application per process, so every pop-out window lives on one shared gui thread
+_visuals = []
+_visuals_lock = threading.Lock()
+_gui_thread = None
+
+# ran as a seperate thread, creates new windows and keeps every window responsive
+def _run_gui():
+    app = QApplication([])
+
+    while True:
+        with _visuals_lock:
+            visuals = list(_visuals)
+
+        for visual in visuals:
+            if visual.window == None:
+                visual.start()
+
+            if visual.is_open and not visual.window.isActiveWindow():
+                visual.window.show()
+
+                # apply mica style
+                win32mica.ApplyMica(visual.window.winId(), darkdetect.isDark())
+
+        app.processEvents()
+        time.sleep(0.2)
+
 class Visual():
-    def __init__(self):
+    def __init__(self, title: str="Chess Bot Board"):
+        global _gui_thread
+
         super().__init__()
 
         # set open flag to false
@@ -31,40 +59,40 @@ class Visual():
 
         self.prev_move = None
 
-        t = threading.Thread(target=self.start)
-        t.start()
-
-    def start(self):
-        self.app = QApplication([])
+        self.title = title
 
-        self.window = QMainWindow()
+        # created by the gui thread, updates made before then are drawn once it exists
+        self.window = None
+        self.pending = ("8/8/8/8/8/8/8/8",)
 
-        self.window.setWindowTitle("Chess Bot Board")
+        with _visuals_lock:
+            _visuals.append(self)
 
-        self.window.setStyleSheet("background-color: rgba(0, 0, 0, 0)")
-        self.window.setWindowFlags(Qt.WindowStaysOnTopHint)
+            if _gui_thread == None:
+                _gui_thread = threading.Thread(target=_run_gui, daemon=True)
+                _gui_thread.start()
 
+    def start(self):
         self.label = QLabel()
         self.label.setAlignment(Qt.AlignCenter)
-        self.window.setCentralWidget(self.label)
 
-        self.update("8/8/8/8/8/8/8/8")
+        window = QMainWindow()
 
-        self.window.resizeEvent = self.resizeEvent
-        self.window.closeEvent = self.closeEvent
+        window.setWindowTitle(self.title)
 
-        self.window.setGeometry(100, 100, 400, 400)
+        window.setStyleSheet("background-color: rgba(0, 0, 0, 0)")
+        window.setWindowFlags(Qt.WindowStaysOnTopHint)
 
-        while True:
-            if self.is_open and not self.window.isActiveWindow():
-                self.window.show()
+        window.setCentralWidget(self.label)
 
-                # apply mica style
-                win32mica.ApplyMica(self.window.winId(), darkdetect.isDark())
+        window.resizeEvent = self.resizeEvent
+        window.closeEvent = self.closeEvent
 
-            self.app.processEvents()
-            time.sleep(0.2)
+        window.setGeometry(100, 100, 400, 400)
 
+        self.window = window
+
+        self.update(*self.pending)
 
     def show(self):
 
@@ -83,6 +111,10 @@ class Visual():
 
     def update(self, fen, check=None, lastmove=None, valid_moves=None):
 
+        if self.window == None:
+            self.pending = (fen, check, lastmove, valid_moves)
+            return
+
         board = chess.Board(fen)
 
         squares = {}
@@ -1,6 +1,6 @@
 import subprocess
-import json
 import threading
+from settings_store import settings
 
 try:
     import openai
@@ -14,12 +14,8 @@ except:
 def reset_history():
     global message_history
 
-    try:
-        # load settings file
-        with open('settings.json') as json_file:
-            settings = json.load(json_file)
-    except:
-        pass
+    # pick up changes to the settings file
+    settings.reload()
 
     message_history = [
         {"role": "system", "content": "You are a chess robot that plays a role."},
@@ -29,12 +25,8 @@ def reset_history():
 def get_response(message):
     global message_history, api_response
 
-    try:
-        # load settings file
-        with open('settings.json') as json_file:
-            settings = json.load(json_file)
-    except:
-        pass
+    # pick up changes to the settings file
+    settings.reload()
 
     # set api key
     openai.api_key = settings["gpt"]["api-key"]
@@ -77,5 +69,11 @@ def get_response(message):
     else:
         return "Error: failed to contact ChatGPT API"
     
+# keeps the prompt of the current conversation in sync with the settings
+def update_prompt(changed_keys):
+    message_history[1]["content"] = settings["gpt"]["prompt"]
+
 # initialize history
 reset_history()
+
+settings.subscribe(update_prompt, keys=["gpt"])
@@ -4,13 +4,26 @@ import time
 import matrix_tools
 import os
 import queue
+import threading
+import itertools
+import functools
+import copy
+import collections
+import logging
+from concurrent.futures import Future, CancelledError
 import pyttsx3 # library is stored localy because of a bug with the original
 import chatGPT
 import play_sound
-import board_visual_popout
+import kinematics
+import engine
+import opening_book
+import tablebase
+import analysis_cache
+from occupancy import Occupancy, square_index, popcount, mask_squares
+from move_index import MoveIndex
+from settings_store import settings
 
 try:
-    import stockfish
     import numpy
     from safe_cast import *
     import chess
@@ -18,18 +31,13 @@ try:
     import continuous_threading
 
 except:
-    subprocess.run(["pip", "install", "stockfish", "numpy", "safe-cast", "chess", "nltk", "continuous-threading"])
-    import stockfish
+    subprocess.run(["pip", "install", "numpy", "safe-cast", "chess", "nltk", "continuous-threading"])
     import numpy
     from safe_cast import *
     import chess
     import nltk
     import continuous_threading
 
-# load settings file
-with open('settings.json') as json_file:
-    settings = json.load(json_file)
-
 # load arpabet, maps words to mouth shapes
 try:
     arpabet = nltk.corpus.cmudict.dict()
@@ -37,13 +45,30 @@ except:
     nltk.download("cmudict")
     arpabet = nltk.corpus.cmudict.dict()
 
-# stores menu prompts to be handeled by the gui in main.py
+# stores menu prompts that don't belong to a robot, each RobotSession has its own prompt_queue
 prompt_queue = queue.Queue()
 
-# initialize stockfish chess engine
+logger = logging.getLogger(__name__)
+
+# sends log records to the log file in the settings, called once by each entry point
+# the terminal ui owns the console, so nothing is logged there
+def configure_logging():
+    logging.basicConfig(filename=f"{os.path.dirname(os.path.abspath(__file__))}/{settings['logging']['file'].lstrip('/')}",
+                        level=getattr(logging, settings["logging"]["level"].upper(), logging.INFO),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+# initialize the stockfish engine processes, searches run on the pool's own threads
 stockfish_ready = False
 try:
-    sf = stockfish.Stockfish(path=f"{os.path.dirname(os.path.abspath(__file__))}{settings['stockfish']['path']}")
+    engine_pool = engine.EnginePool(path=f"{os.path.dirname(os.path.abspath(__file__))}{settings['stockfish']['path']}",
+                                    size=settings["stockfish"]["processes"],
+                                    depth=settings["stockfish"]["depth"],
+                                    movetime=settings["stockfish"]["movetime"],
+                                    nodes=settings["stockfish"]["nodes"],
+                                    threads=settings["stockfish"]["threads"],
+                                    hash_size=settings["stockfish"]["hash"],
+                                    analysis_cache=analysis_cache.load(settings["stockfish"]["analysis-cache"], settings["stockfish"]["analysis-cache-size"]),
+                                    tablebase=tablebase.load(settings["stockfish"]["syzygy-path"]))
 
     stockfish_ready = True
 
@@ -53,74 +78,44 @@ if not stockfish_ready:
     # binary not found, notify user and prompt them to quit
     prompt_queue.put((("[app.title]Error", "", "[app.label]Stockfish engine binary not found..."), {"Quit": quit}))
 
-pos_z = 0
-pos_x = -settings["hardware"]["length-arm-1"]
-pos_y = -settings["hardware"]["length-arm-2"]
-pos_joint1 = 90
-pos_joint2 = 90
-grabber_state = "closed"
-
-if stockfish_ready:
-    wdl_stats = sf.get_wdl_stats()
-    board_visual = sf.get_board_visual()
-else:
-    wdl_stats = [0, 1000, 0]
-    board_visual = ""
-
-# initialize board svg window
-board_popout_window = board_visual_popout.Visual()
-
-# returns wdl stats in the form of a bar visuas
-def get_stats_visual():
-       
-    bar_height = 12
+# returns a text visual of a board, same layout as stockfish's board visual
+def get_board_text(board: chess.Board):
+    separator = "+---+---+---+---+---+---+---+---+"
 
-    white = '▓\n' * round(((wdl_stats[0] + (wdl_stats[1] / 2)) * bar_height) / 1000)
-    black = '░\n' * round(((wdl_stats[2] + (wdl_stats[1] / 2)) * bar_height) / 1000)
+    lines = [separator]
 
-    wdl_stats_visual = f"B\n—\n░\n{black}{white}▓\n—\nW"
-    
-    return wdl_stats_visual
+    for row in reversed(range(8)):
+        pieces = []
 
-# returns board visuals
-def get_board_visual():
-    global settings, board_matrix
+        for column in range(8):
+            piece = board.piece_at(chess.square(column, row))
+            pieces.append(piece.symbol() if piece != None else " ")
 
-    try:
-        # load settings file
-        with open('settings.json') as json_file:
-            settings = json.load(json_file)
-    except:
-        pass
+        lines.append(f"| {' | '.join(pieces)} | {row + 1}")
+        lines.append(separator)
 
-    board_matrix = matrix_tools.string2matrix(board_visual, 2)
+    lines.append("  a   b   c   d   e   f   g   h")
 
-    # draw arm 1
-    a1_end_x, a1_end_y = matrix_tools.calculate_end_coordinates(5, -1, (pos_joint1 - 180), settings["gui"]["length-terminal-arm-1"])
-    updated_matrix = matrix_tools.draw_line(board_matrix, 5, -1, a1_end_x, a1_end_y, char="▒")
-    
-    # draw arm 2
-    a2_end_x, a2_end_y = matrix_tools.calculate_end_coordinates(a1_end_x, a1_end_y, (pos_joint1 + pos_joint2 - 180), settings["gui"]["length-terminal-arm-2"])
-    updated_matrix = matrix_tools.draw_line(updated_matrix, a1_end_x, a1_end_y, a2_end_x, a2_end_y, char="▓")
+    return "\n".join(lines) + "\n"
 
-    return matrix_tools.matrix2string(updated_matrix)
+# joint angles of every named board position, rebuilt when the geometry or board positions change
+ik_table = kinematics.IKTable()
 
-# inverse kinematics junk, source: https://github.com/aakieu/2-dof-planar/blob/master/python/inverse_kinematics.py
-def _get_servo_angles(x, y, a1, a2):
+# the pico runs at most one trajectory waypoint per mainloop iteration (loop_delay of 50 ms)
+# higher motion sample rates would stretch every trajectory, so they're clamped to this
+max_sample_rate = 20
 
-    # equations for Inverse kinematics
-    r1 = numpy.sqrt(x ** 2 + y ** 2)  # radius equation
-    phi_1 = -numpy.arccos((a2 ** 2 - a1 ** 2 - r1 ** 2) /
-                          (-2 * a1 * r1))  # eqauation 1
-    phi_2 = numpy.arctan2(y, -x)  # equation 2
-    phi_3 = -numpy.arccos((r1 ** 2 - a1 ** 2 - a2 ** 2) /
-                          (-2 * a1 * a2))  # equation 3
+# returns the servo angle for a grabber state, including the joint offset
+def _get_grabber_angle(state: str):
 
-    theta_1 = 180 - numpy.rad2deg(phi_2 - phi_1)
+    if state == "open":
+        joint3 = settings["hardware"]["grabber-open-angle"]
+    elif state == "closed":
+        joint3 = settings["hardware"]["grabber-closed-angle"]
+    elif state == "calibrate":
+        joint3 = 90
 
-    theta_2 = numpy.rad2deg(phi_3) + 180
-
-    return theta_1, theta_2
+    return joint3 + settings["joint-offsets"]["3"]
 
 # merges dictionaries without overwriting sub directories
 def merge_dicts(dict1: dict, dict2: dict):
@@ -134,25 +129,384 @@ def merge_dicts(dict1: dict, dict2: dict):
             dict1[key] = value
 
 
-class SerialInterface():
+# stands in for the board pop-out window on headless hosts
+class NoPopout():
+    is_open = False
+
+    def show(self):
+        pass
+
+    def update(self, fen, check=None, lastmove=None, valid_moves=None):
+        pass
+
+# one robot: its serial channel, arm pose, game and board pop-out, several can run side by side
+class RobotSession():
 
-    def __init__(self, serial_class):
-        global pos_joint1, pos_joint2
+    # popout=False runs without the board pop-out window, qt isn't loaded at all
+    def __init__(self, serial_class, name: str="robot", popout: bool=True):
 
         # initialize variables
         self.serial = serial_class
+        self.name = name
         self.board_ready = False
+
+        # stores menu prompts of this robot to be handeled by the gui in main.py or the server
+        self.prompt_queue = queue.Queue()
         self.game_state = "inactive"
         self.continue_game = False
-        pos_joint1, pos_joint2 = _get_servo_angles(pos_x, pos_y, settings["hardware"]["length-arm-1"], settings["hardware"]["length-arm-2"])
+
+        # set by close, stops the reader and writer threads
+        self.closed = False
+
+        # arm pose, the board doesn't report it so it's tracked from the commands sent
+        self.pos_z = 0
+        self.pos_x = -settings["hardware"]["length-arm-1"]
+        self.pos_y = -settings["hardware"]["length-arm-2"]
+        self.grabber_state = "closed"
+        self.pos_joint1, self.pos_joint2 = kinematics.get_servo_angles(self.pos_x, self.pos_y, settings["hardware"]["length-arm-1"], settings["hardware"]["length-arm-2"])
+
+        # seconds to wait for the board to answer a request before retrying
+        self.response_timeout = 2
+
+        # requests sent before giving up on the board answering
+        self.request_attempts = 5
+
+        # seconds to wait for the board to report a motion has finished before giving up on it
+        self.motion_timeout = 10
+
+        # requests waiting on a response from the board, keyed by sequence id
+        self._pending = {}
+
+        # requests waiting on a completion event from the board (trajectory-done, motion-done), keyed by sequence id
+        self._completions = {}
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._sequence = itertools.count(1)
+
+        # packets waiting to be written by the writer thread, pending data updates are merged together
+        self._outbound = collections.deque()
+        self._outbound_ready = threading.Condition()
+
+        # callbacks fed with every occupancy the board streams, keyed by the id of their subscription
+        self._board_subscribers = {}
+        self._subscribers_lock = threading.Lock()
+
+        # last occupancy streamed by the board, None until the first event arrives
+        self.occupancy = None
+
+        # local copy of the game, the engine is only used to search positions
+        self.game_board = chess.Board()
+        self.board_visual = get_board_text(self.game_board)
+
+        # optional polyglot opening book, loaded when a game starts
+        self.book = None
+
+        # searches of this robot's games, the engine processes are shared by every robot
+        self.sf = engine_pool.session(name) if stockfish_ready else None
+
+        # the stats show an even position until the search of the starting position finishes
+        self.wdl_stats = [0, 1000, 0]
+
+        if stockfish_ready:
+            self.sf.analyse(self.game_board).add_done_callback(self._initial_analysis_done)
+
+        # initialize board svg window
+        if popout:
+            import board_visual_popout
+
+            self.board_popout_window = board_visual_popout.Visual(f"Chess Bot Board - {name}")
+        else:
+            self.board_popout_window = NoPopout()
+
+        # one reader thread owns the inbound side of the serial port
+        self._reader_thread = threading.Thread(target=self._read_serial, daemon=True)
+        self._reader_thread.start()
+
+        # one writer thread owns the outbound side, sending at most max-packet-rate packets per second
+        self._writer_thread = threading.Thread(target=self._write_serial, daemon=True)
+        self._writer_thread.start()
+
+    # returns wdl stats in the form of a bar visuas
+    def get_stats_visual(self):
+       
+        bar_height = 12
+
+        white = '▓\n' * round(((self.wdl_stats[0] + (self.wdl_stats[1] / 2)) * bar_height) / 1000)
+        black = '░\n' * round(((self.wdl_stats[2] + (self.wdl_stats[1] / 2)) * bar_height) / 1000)
+
+        wdl_stats_visual = f"B\n—\n░\n{black}{white}▓\n—\nW"
+        
+        return wdl_stats_visual
+
+    # returns board visuals
+    def get_board_visual(self):
+
+        # pick up changes to the settings file
+        settings.reload()
+
+        board_matrix = matrix_tools.string2matrix(self.board_visual, 2)
+
+        # draw arm 1
+        a1_end_x, a1_end_y = matrix_tools.calculate_end_coordinates(5, -1, (self.pos_joint1 - 180), settings["gui"]["length-terminal-arm-1"])
+        updated_matrix = matrix_tools.draw_line(board_matrix, 5, -1, a1_end_x, a1_end_y, char="▒")
+        
+        # draw arm 2
+        a2_end_x, a2_end_y = matrix_tools.calculate_end_coordinates(a1_end_x, a1_end_y, (self.pos_joint1 + self.pos_joint2 - 180), settings["gui"]["length-terminal-arm-2"])
+        updated_matrix = matrix_tools.draw_line(updated_matrix, a1_end_x, a1_end_y, a2_end_x, a2_end_y, char="▓")
+
+        return matrix_tools.matrix2string(updated_matrix)
+
+    # ran as a seperate thread, frames lines sent by the board and hands them to their pending requests
+    def _read_serial(self):
+        buffer = b""
+        was_open = False
+
+        while not self.closed:
+            if not self.serial.is_open:
+                buffer = b""
+                was_open = False
+                self.occupancy = None
+                self._fail_pending(ConnectionError("chess robot not connected"))
+                time.sleep(0.1)
+                continue
+
+            # the board forgets its stream state when it resets, ask for it again after reconnecting
+            if not was_open:
+                was_open = True
+
+                if self._board_subscribers:
+                    self._set_board_stream(True)
+
+            try:
+                # blocks until at least one byte arrives or the port times out
+                buffer += self.serial.read(max(1, self.serial.in_waiting))
+            except:
+                time.sleep(0.1)
+                continue
+
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                self._handle_line(line)
+
+    # routes one line from the board to the request that it answers
+    def _handle_line(self, line: bytes):
+        try:
+            packet = json.loads(line.decode("utf-8").strip())
+        except:
+            return
+
+        if not isinstance(packet, dict):
+            return
+
+        # unsolicited events are not tied to a request
+        if "event" in packet:
+            self._handle_event(packet)
+            return
+
+        if "id" not in packet:
+            return
+
+        with self._pending_lock:
+            future = self._pending.pop(packet["id"], None)
+
+        if future is not None and not future.done():
+            future.set_result(packet.get("response"))
+
+    # passes events pushed by the board on to their subscribers
+    def _handle_event(self, packet: dict):
+
+        # a long running command has finished on the board
+        if packet["event"] in ["trajectory-done", "motion-done"]:
+            with self._pending_lock:
+                future = self._completions.pop(packet.get("id"), None)
+
+            if future is not None and not future.done():
+                future.set_result(packet)
+
+        if packet["event"] == "board-bits":
+            self.occupancy = Occupancy.from_hex(packet["board-bits"])
+
+            with self._subscribers_lock:
+                subscribers = list(self._board_subscribers.values())
+
+            for callback in subscribers:
+                try:
+                    callback(self.occupancy)
+                except:
+                    pass
+
+    # fails every request still waiting on the board
+    def _fail_pending(self, error: Exception):
+        with self._outbound_ready:
+            self._outbound.clear()
+
+        with self._pending_lock:
+            pending = list(self._pending.values()) + list(self._completions.values())
+            self._pending.clear()
+            self._completions.clear()
+
+        for future in pending:
+            if not future.done():
+                future.set_exception(error)
+
+    # ran as a seperate thread, writes queued packets to the board no faster than max-packet-rate
+    def _write_serial(self):
+
+        while not self.closed:
+            with self._outbound_ready:
+                while not self._outbound and not self.closed:
+                    self._outbound_ready.wait()
+
+                if self.closed:
+                    return
+
+                packet = self._outbound.popleft()["packet"]
+
+            try:
+                with self._write_lock:
+                    self.serial.write(f'{json.dumps(packet)}\n'.encode())
+                    self.serial.flush()
+
+            except Exception as e:
+                with self._pending_lock:
+                    futures = [self._pending.pop(packet["id"], None), self._completions.pop(packet["id"], None)]
+
+                for future in futures:
+                    if future is not None and not future.done():
+                        future.set_exception(e)
+
+            # updates queued while we wait are merged into a single packet
+            time.sleep(1 / max(1, settings["hardware"]["max-packet-rate"]))
+
+    # queues a packet tagged with a sequence id, returns a future that is completed with the board's response
+    # if a completion future is given it is completed by the event the board sends when the command finishes
+    # packets that only contain data are merged into a queued data packet if one is waiting, last value wins
+    def _send(self, packet: dict, completion: Future=None):
+
+        if not self.serial.is_open:
+            raise ConnectionError("chess robot not connected")
+
+        packet = copy.deepcopy(packet)
+
+        with self._outbound_ready:
+            coalesce = (list(packet.keys()) == ["data"]) and (completion == None)
+
+            # merge into the newest queued packet if it is also a plain data update
+            if coalesce and self._outbound and self._outbound[-1]["coalesce"]:
+                merge_dicts(self._outbound[-1]["packet"]["data"], packet["data"])
+
+                return self._outbound[-1]["future"]
+
+            packet["id"] = next(self._sequence)
+
+            future = Future()
+
+            with self._pending_lock:
+                self._pending[packet["id"]] = future
+
+                if completion != None:
+                    self._completions[packet["id"]] = completion
+
+            self._outbound.append({"packet": packet, "future": future, "coalesce": coalesce})
+            self._outbound_ready.notify()
+
+        return future
+
+    # stops waiting on futures of requests that timed out, late responses and completion events for them are ignored
+    def _forget(self, *futures):
+        with self._pending_lock:
+            for waiting in (self._pending, self._completions):
+                for id, future in list(waiting.items()):
+                    if any(future is forgotten for forgotten in futures):
+                        del waiting[id]
+
+    # sends a request and returns the board's response, None if the port closes
+    # a request that fails or times out is forgotten and sent again, TimeoutError is raised after request_attempts tries
+    def _request(self, packet: dict):
+
+        for attempt in range(self.request_attempts):
+            if not self.serial.is_open:
+                return None
+
+            future = None
+
+            try:
+                future = self._send(packet)
+
+                return future.result(timeout=self.response_timeout)
+
+            except:
+                self._forget(future)
+
+        if not self.serial.is_open:
+            return None
+
+        raise TimeoutError(f"chess robot didn't answer {self.request_attempts} requests for {packet}")
+
+    # turns the board's change driven sensor stream on or off
+    def _set_board_stream(self, enabled: bool):
+        try:
+            self._send({"data": {"stream-board": enabled}})
+        except:
+            pass
+
+    # calls callback with an occupancy every time the board sensors change
+    # if no callback is given a queue is returned that receives each occupancy instead
+    # the returned object is passed to unsubscribe_board to stop receiving updates
+    def subscribe_board(self, callback=None):
+        
+        subscription = callback
+
+        if callback == None:
+            subscription = queue.Queue()
+            callback = subscription.put
+
+        with self._subscribers_lock:
+            self._board_subscribers[id(subscription)] = callback
+            first = len(self._board_subscribers) == 1
+
+        # start streaming when the first subscriber arrives
+        if first and self.serial.is_open:
+            self._set_board_stream(True)
+
+        return subscription
+
+    # stops updates to a subscription returned by subscribe_board
+    def unsubscribe_board(self, subscription):
+
+        with self._subscribers_lock:
+            removed = self._board_subscribers.pop(id(subscription), None) != None
+            last = len(self._board_subscribers) == 0
+
+        # stop streaming when nobody is listening
+        if removed and last and self.serial.is_open:
+            self._set_board_stream(False)
+
+    # blocks until condition returns true for the board occupancy or the game is ended
+    def wait_for_board(self, condition):
+
+        board_queue = self.subscribe_board()
+
+        try:
+            board = self.get_board(suppress_errors=True)
+
+            while board != None and not condition(board) and self.continue_game:
+                try:
+                    board = board_queue.get(timeout=1)
+                except queue.Empty:
+                    pass
+
+        finally:
+            self.unsubscribe_board(board_queue)
 
     def check_connection(self):
         
         connected = False
         for index in range(10):
             try:
-                # push an empty packet
-                self.serial.write('{}\n'.encode())
+                # push an empty packet straight to the port, skipping the outbound queue
+                with self._write_lock:
+                    self.serial.write('{}\n'.encode())
 
                 connected = True
                 break
@@ -165,54 +519,28 @@ class SerialInterface():
         if not connected:
             self.serial.close()
 
-    # returns board dictionary
+    # returns an occupancy of the board sensors, raises TimeoutError if the board stops answering
     def get_board(self, suppress_errors: bool=False):
         
-        while True:
-            if self.serial.is_open:
-                try:
-                    # request board
-                    self.serial.write('{"return":"board"}\n'.encode())
-
-                    self.serial.flush()
-
-                    line = self.serial.read(self.serial.in_waiting).decode("utf-8").strip()
+        # request the packed sensor bits and wait for the matching response
+        response = self._request({"return": "board-bits"})
 
-                    # save board dictionary
-                    board = json.loads(line)["response"]["board"]
+        if response != None:
+            return Occupancy.from_hex(response["board-bits"])
 
-                    return board
-
-                except:
-                    pass
-            else:
-                if not suppress_errors:
-                    prompt_queue.put((("[app.title]Not Connected", "", "[app.label]Failed to fetch board,", "[app.label]chess robot not connected..."), {"Ok": None}))
-                break
+        if not suppress_errors:
+            self.prompt_queue.put((("[app.title]Not Connected", "", "[app.label]Failed to fetch board,", "[app.label]chess robot not connected..."), {"Ok": None}))
 
     def get_effects(self, suppress_errors: bool=False):
 
-        while True:
-            if self.serial.is_open:
-                try:
-                    # request board
-                    self.serial.write('{"return":"fx-list"}\n'.encode())
-
-                    self.serial.flush()
-
-                    line = self.serial.read(self.serial.in_waiting).decode("utf-8")
+        # request effects list and wait for the matching response
+        response = self._request({"return": "fx-list"})
 
-                    # save effects list
-                    effects = json.loads(line)["response"]["fx-list"]
+        if response != None:
+            return response["fx-list"]
 
-                    return effects
-
-                except:
-                    pass
-            else:
-                if not suppress_errors:
-                    prompt_queue.put((("[app.title]Not Connected", "", "[app.label]Failed to fetch led effects,", "[app.label]chess robot not connected..."), {"Ok": None}))
-                break
+        if not suppress_errors:
+            self.prompt_queue.put((("[app.title]Not Connected", "", "[app.label]Failed to fetch led effects,", "[app.label]chess robot not connected..."), {"Ok": None}))
     
     # sets chess bots led strip
     def set_leds(self, macro: str, custom_data: dict=None, suppress_errors: bool=False):
@@ -220,13 +548,13 @@ class SerialInterface():
         if custom_data != None:
             pass
 
-        # load settings file
-        with open('settings.json') as json_file:
-            settings = json.load(json_file)
+        # pick up changes to the settings file
+        settings.reload()
         
         if macro in settings["led-strip"]["macros"]:
 
-            data = settings["led-strip"]["macros"][macro]
+            # copied so custom data doesn't leak into the shared settings
+            data = copy.deepcopy(settings["led-strip"]["macros"][macro])
 
             if custom_data != None:
                 merge_dicts(data, custom_data)
@@ -236,190 +564,358 @@ class SerialInterface():
                                     }})
             
         elif not suppress_errors:
-            prompt_queue.put((("[app.title]Not Connected", "", "[app.label]Failed to set led effect,", "[app.label]invalid macro..."), {"Ok": None}))
+            self.prompt_queue.put((("[app.title]Not Connected", "", "[app.label]Failed to set led effect,", "[app.label]invalid macro..."), {"Ok": None}))
 
-    # pushes a change to the chess board to preview it
+    # pushes a change to the chess board to preview it, returns a future completed when the board acknowledges it
     def push_data(self, data: dict, suppress_errors: bool=False):
 
-        while True:
-            if self.serial.is_open:
-                try:
-                    self.serial.write(f'{json.dumps(data)}\n'.encode())
+        if self.serial.is_open:
+            try:
+                return self._send(data)
 
-                    self.serial.flush()
-                    break
-                
-                except:
-                    pass
-            elif not suppress_errors:
-                prompt_queue.put((("[app.title]Not Connected", "", "[app.label]Failed to push data,", "[app.label]chess robot not connected...", "", f"[app.label]{data}"), {"Ok": None}))
-                break
+            except:
+                pass
 
-    # moves arm, grabber, and z axis to desired position
-    def goto_position(self, x: float=None, y: float=None, z: float=None, grabber: str=None, retract: bool=True, suppress_errors: bool=False):
-        global pos_y, pos_x, pos_z, grabber_state, pos_joint1, pos_joint2, settings
+        if not suppress_errors:
+            self.prompt_queue.put((("[app.title]Not Connected", "", "[app.label]Failed to push data,", "[app.label]chess robot not connected...", "", f"[app.label]{data}"), {"Ok": None}))
+
+    # pushes actuator targets, then blocks until the board reports they have been reached
+    # keys limits the wait to those actuators (such as ["angle-joint1"]), returns false if the motion did not finish in time
+    def push_motion(self, data: dict, keys: list=None, timeout: float=None, suppress_errors: bool=False):
+
+        if timeout == None:
+            timeout = self.motion_timeout
 
         if self.serial.is_open:
+            done = Future()
+
+            packet = copy.deepcopy(data)
+            packet["data"]["servo-speed"] = settings["hardware"]["servo-speed-deg/sec"]
+            packet["wait"] = keys if keys != None else True
+
+            response = None
+
             try:
-                # load settings file
-                with open('settings.json') as json_file:
-                    settings = json.load(json_file)
+                response = self._send(packet, completion=done)
+
+                done.result(timeout=timeout)
+
+                return True
+
             except:
-                pass
+                self._forget(response, done)
+
+        if not suppress_errors and not self.serial.is_open:
+            self.prompt_queue.put((("[app.title]Not Connected", "", "[app.label]Failed to push motion,", "[app.label]chess robot not connected..."), {"Ok": None}))
+
+        return False
+
+    # moves arm, grabber, and z axis to desired position
+    # the arm joints always wait for each other, wait also blocks until the z axis and grabber have arrived
+    def goto_position(self, x: float=None, y: float=None, z: float=None, grabber: str=None, retract: bool=True, wait: bool=True, timeout: float=None, suppress_errors: bool=False):
+
+        if self.serial.is_open:
+            # pick up changes to the settings file
+            settings.reload()
             
             data = {"data": {}}
 
             if z != None:
-                pos_z = safe_float(z)
-                data["data"]["position-z"] = pos_z
+                self.pos_z = safe_float(z)
+                data["data"]["position-z"] = self.pos_z
 
             if grabber != None:
-                grabber_state = safe_str(grabber)
-
-                if grabber_state == "open":
-                    joint3 = settings["hardware"]["grabber-open-angle"]
-                elif grabber_state == "closed":
-                    joint3 = settings["hardware"]["grabber-closed-angle"]
-                elif grabber_state == "calibrate":
-                    joint3 = 90
+                self.grabber_state = safe_str(grabber)
 
-                data["data"]["angle-joint3"] = joint3 + settings["joint-offsets"]["3"]
+                data["data"]["angle-joint3"] = _get_grabber_angle(self.grabber_state)
 
             # push z axis and grabber states to the board
-            self.push_data(data, suppress_errors=suppress_errors)
+            if data["data"]:
+                self.push_data(data, suppress_errors=suppress_errors)
 
             xy_update = False
             
             if x == None:
-                x = pos_x
+                x = self.pos_x
             else:
                 xy_update = True
 
             if y == None:
-                y = pos_y
+                y = self.pos_y
             else:
                 xy_update = True
 
+            # move both joints at once as a trajectory run by the board
+            if xy_update and settings["hardware"]["motion-mode"] != "sequential":
+                self.run_trajectory(self._arm_waypoints(x, y, retract), timeout=(timeout if timeout != None else self.motion_timeout), suppress_errors=suppress_errors)
+
             # keep within radial constraints of the arm
-            if numpy.sqrt((x ** 2) + (y ** 2)) < (settings["hardware"]["length-arm-1"] + settings["hardware"]["length-arm-2"]) and xy_update:
+            elif xy_update and kinematics.reachable((x, y), settings["hardware"]["length-arm-1"], settings["hardware"]["length-arm-2"])[0]:
 
-                pos_x = safe_float(x)
-                pos_y = safe_float(y)
+                self.pos_x = safe_float(x)
+                self.pos_y = safe_float(y)
                 
                 # get the updated joint angles
-                new_joint1, new_joint2 = _get_servo_angles(pos_x, pos_y, settings["hardware"]["length-arm-1"], settings["hardware"]["length-arm-2"])
+                new_joint1, new_joint2 = kinematics.get_servo_angles(self.pos_x, self.pos_y, settings["hardware"]["length-arm-1"], settings["hardware"]["length-arm-2"])
                 
-                if (pos_joint2 < settings["hardware"]["retraction-angle"]) and retract:
-                    # move mass as close to joint 1 as possible
-                    self.push_data({"data": {"angle-joint2": settings["hardware"]["retraction-angle"]}}, suppress_errors=suppress_errors)
-                
-                    # wait for servo to finish
-                    time.sleep(abs(settings["hardware"]["retraction-angle"] - pos_joint2) * (1 / settings["hardware"]["servo-speed-deg/sec"]))
-
-                # move joint 1 into position
-                self.push_data({"data": {"angle-joint1": new_joint1 - 90 + settings["joint-offsets"]["1"]}}, suppress_errors=suppress_errors)
+                if (self.pos_joint2 < settings["hardware"]["retraction-angle"]) and retract:
+                    # move mass as close to joint 1 as possible, wait for servo to finish
+                    self.push_motion({"data": {"angle-joint2": settings["hardware"]["retraction-angle"]}}, keys=["angle-joint2"], timeout=timeout, suppress_errors=suppress_errors)
 
-                # wait for servo to finish
-                time.sleep(abs(new_joint1 - pos_joint1) * (1 / settings["hardware"]["servo-speed-deg/sec"]))
+                # move joint 1 into position, wait for servo to finish
+                self.push_motion({"data": {"angle-joint1": new_joint1 - 90 + settings["joint-offsets"]["1"]}}, keys=["angle-joint1"], timeout=timeout, suppress_errors=suppress_errors)
 
                 # move joint 2 into position
                 self.push_data({"data": {"angle-joint2": new_joint2 + settings["joint-offsets"]["2"]}}, suppress_errors=suppress_errors)
 
-                # wait for servo to finish
-                time.sleep(abs(new_joint2 - pos_joint2) * (1 / settings["hardware"]["servo-speed-deg/sec"]))
-
                 # we are done processing moves, update joint vars to reflect changes
-                pos_joint1 = new_joint1
-                pos_joint2 = new_joint2
+                self.pos_joint1 = new_joint1
+                self.pos_joint2 = new_joint2
+
+            # wait for every actuator to finish
+            if wait:
+                self.push_motion({"data": {}}, timeout=timeout, suppress_errors=suppress_errors)
 
         elif not suppress_errors:
-            prompt_queue.put((("[app.title]Not Connected", "", "[app.label]Failed to goto position,", "[app.label]chess robot not connected..."), {"Ok": None}))
+            self.prompt_queue.put((("[app.title]Not Connected", "", "[app.label]Failed to goto position,", "[app.label]chess robot not connected..."), {"Ok": None}))
 
-    def make_move(self, move):
-        # goto pick up piece
-        position = settings["board-positions"][move[1]][move[0]]
-        self.goto_position(x=position[0], y=position[1], suppress_errors=True)
+    # returns trajectory waypoints that move the arm over (x, y) using the configured motion-mode
+    # "sequential" moves one joint at a time, "joint" and "cartesian" move both joints at once
+    # angles are the precomputed (joint 1, joint 2) angles of the target, if known
+    def _arm_waypoints(self, x: float, y: float, retract: bool=True, angles: tuple=None):
 
-        # plunge
-        self.goto_position(z=0, grabber="open", suppress_errors=True)
+        if angles == None:
+            solved, valid = kinematics.solve((x, y), settings["hardware"]["length-arm-1"], settings["hardware"]["length-arm-2"])
 
-        time.sleep(1.5)
+            # keep within radial constraints of the arm
+            if not valid[0]:
+                return []
 
-        # go up
-        self.goto_position(z=settings["board-positions"]["home"]["height"], grabber="closed", suppress_errors=True)
+            angles = tuple(solved[0])
 
-        time.sleep(2)
+        if settings["hardware"]["motion-mode"] == "sequential":
+            return self._sequential_arm_waypoints(x, y, angles, retract)
 
-        # goto set down piece
-        position = settings["board-positions"][move[3]][move[2]]
-        self.goto_position(x=position[0], y=position[1], suppress_errors=True)
+        return self._synchronized_arm_waypoints(x, y, angles, retract)
 
-        # plunge
-        self.goto_position(z=0, suppress_errors=True)
+    # returns trajectory waypoints that move the arm over a named board position ("e2", "home", "clear-0", ...)
+    # joint angles come from the ik table instead of being recomputed
+    def _named_arm_waypoints(self, name: str, retract: bool=True):
+        ik_table.update(settings)
+
+        x, y = ik_table.position(name)
+
+        return self._arm_waypoints(x, y, retract, angles=ik_table.joint_angles(name))
+
+    # returns trajectory waypoints that move the arm over (x, y) one joint at a time, retracting joint 2 first if needed
+    def _sequential_arm_waypoints(self, x: float, y: float, angles: tuple, retract: bool=True):
+
+        waypoints = []
+
+        self.pos_x = safe_float(x)
+        self.pos_y = safe_float(y)
+
+        new_joint1, new_joint2 = angles
+
+        if (self.pos_joint2 < settings["hardware"]["retraction-angle"]) and retract:
+            # move mass as close to joint 1 as possible
+            waypoints.append({"data": {"angle-joint2": settings["hardware"]["retraction-angle"]}, "until": "reached"})
+
+        # move joint 1 then joint 2 into position
+        waypoints.append({"data": {"angle-joint1": new_joint1 - 90 + settings["joint-offsets"]["1"]}, "until": "reached"})
+        waypoints.append({"data": {"angle-joint2": new_joint2 + settings["joint-offsets"]["2"]}, "until": "reached"})
+
+        self.pos_joint1 = new_joint1
+        self.pos_joint2 = new_joint2
 
-        time.sleep(1.5)
+        return waypoints
 
-        # go up
-        self.goto_position(z=settings["board-positions"]["home"]["height"], grabber="open", suppress_errors=True)
+    # returns trajectory waypoints that move both joints at once, scaled so they arrive together
+    # the schedule is sampled at motion-sample-rate and run by the board as one trajectory
+    # in "cartesian" mode the grabber follows a straight line, in "joint" mode both joints sweep linearly
+    # when retracting, joint 2 stays inside a retraction envelope, it rises toward the retraction angle at full speed and
+    # comes back down at full speed to arrive on time, joint 1 only swings while joint 2 is above retraction-sweep-angle
+    # so the fold, the swing and the unfold overlap
+    def _synchronized_arm_waypoints(self, x: float, y: float, angles: tuple, retract: bool=True):
 
-        time.sleep(2)
+        arm1 = settings["hardware"]["length-arm-1"]
+        arm2 = settings["hardware"]["length-arm-2"]
+        speed = settings["hardware"]["servo-speed-deg/sec"]
+        retraction = settings["hardware"]["retraction-angle"]
+        sweep_angle = min(settings["hardware"]["retraction-sweep-angle"], retraction)
+        sample_rate = min(max(1, settings["hardware"]["motion-sample-rate"]), max_sample_rate)
+
+        new_joint1, new_joint2 = angles
+
+        fold = retract and (self.pos_joint2 < retraction)
+
+        # the slowest joint sets the pace, the other is slowed down to match it
+        duration = max(abs(new_joint1 - self.pos_joint1), abs(new_joint2 - self.pos_joint2)) / speed
+
+        # joint 1 swings between the moment joint 2 rises past the sweep angle and the moment it has to drop below it again
+        if fold:
+            sweep_start = max(0, sweep_angle - self.pos_joint2) / speed
+            sweep_end = max(0, sweep_angle - new_joint2) / speed
+
+            duration = max(duration, sweep_start + abs(new_joint1 - self.pos_joint1) / speed + sweep_end)
+
+            # an end angle above the retraction angle raises the top of the envelope
+            ceiling = max(retraction, new_joint2)
+
+        cartesian = (settings["hardware"]["motion-mode"] == "cartesian") and not fold
+
+        if cartesian:
+            # a straight line can need more joint travel than its end points suggest
+            fraction = numpy.linspace(0, 1, 50)[:, None]
+            path, valid = kinematics.solve(numpy.array([self.pos_x, self.pos_y]) + numpy.array([x - self.pos_x, y - self.pos_y]) * fraction, arm1, arm2)
+
+            # fall back to joint space if the line leaves the arm's reach
+            if not valid.all():
+                cartesian = False
+            else:
+                duration = numpy.abs(numpy.diff(path, axis=0)).sum(axis=0).max() / speed
+
+        samples = max(1, int(numpy.ceil(duration * sample_rate)))
+        fraction = numpy.arange(1, samples + 1) / samples
+        elapsed = fraction * duration
+
+        if cartesian:
+            path, valid = kinematics.solve(numpy.array([self.pos_x, self.pos_y]) + numpy.array([x - self.pos_x, y - self.pos_y]) * fraction[:, None], arm1, arm2)
+            joint1, joint2 = path[:, 0], path[:, 1]
+
+        elif fold:
+            sweep = numpy.clip((elapsed - sweep_start) / max(duration - sweep_start - sweep_end, 1e-9), 0, 1)
+
+            joint1 = self.pos_joint1 + (new_joint1 - self.pos_joint1) * sweep
+            joint2 = numpy.minimum(ceiling, numpy.minimum(self.pos_joint2 + speed * elapsed, new_joint2 + speed * (duration - elapsed)))
+
+        else:
+            joint1 = self.pos_joint1 + (new_joint1 - self.pos_joint1) * fraction
+            joint2 = self.pos_joint2 + (new_joint2 - self.pos_joint2) * fraction
+
+        waypoints = []
+
+        for index in range(samples):
+            waypoints.append({"data": {"angle-joint1": float(joint1[index] - 90 + settings["joint-offsets"]["1"]),
+                                       "angle-joint2": float(joint2[index] + settings["joint-offsets"]["2"])},
+                              "hold": round(1000 / sample_rate)})
+
+        # the last sample waits for both joints to arrive
+        waypoints[-1]["until"] = "reached"
+
+        self.pos_x = safe_float(x)
+        self.pos_y = safe_float(y)
+        self.pos_joint1 = new_joint1
+        self.pos_joint2 = new_joint2
+
+        return waypoints
+
+    # returns a trajectory waypoint that moves the z axis and optionally the grabber, held until the z axis arrives
+    def _z_waypoint(self, z: float, grabber: str=None):
+
+        self.pos_z = safe_float(z)
+        waypoint = {"data": {"position-z": self.pos_z}, "until": "reached"}
+
+        if grabber != None:
+            self.grabber_state = grabber
+            waypoint["data"]["angle-joint3"] = _get_grabber_angle(grabber)
+
+        return waypoint
+
+    # returns a trajectory waypoint that only moves the grabber, held for at least hold milliseconds
+    def _grabber_waypoint(self, grabber: str, hold: int=0):
+
+        self.grabber_state = grabber
+
+        return {"data": {"angle-joint3": _get_grabber_angle(grabber)}, "until": "reached", "hold": hold}
+
+    # uploads a list of waypoints that the board runs on its own, blocks until the board reports it has finished
+    # each waypoint is {"data": {...}, "hold": ms, "until": "reached"}, returns false if the board did not finish in time
+    def run_trajectory(self, waypoints: list, timeout: float=60, suppress_errors: bool=False):
+
+        if self.serial.is_open:
+            done = Future()
+
+            response = None
+
+            try:
+                response = self._send({"data": {"servo-speed": settings["hardware"]["servo-speed-deg/sec"]}, "trajectory": waypoints}, completion=done)
+
+                done.result(timeout=timeout)
+
+                return True
+
+            except:
+                self._forget(response, done)
+
+        if not suppress_errors:
+            self.prompt_queue.put((("[app.title]Not Connected", "", "[app.label]Failed to run trajectory,", "[app.label]chess robot not connected..."), {"Ok": None}))
+
+        return False
+
+    def make_move(self, move):
+        home_height = settings["board-positions"]["home"]["height"]
+
+        # goto pick up piece
+        waypoints = self._named_arm_waypoints(move[0:2])
+
+        # plunge, then go up with the piece
+        waypoints.append(self._z_waypoint(0, grabber="open"))
+        waypoints.append(self._z_waypoint(home_height, grabber="closed"))
+
+        # goto set down piece
+        waypoints += self._named_arm_waypoints(move[2:4])
+
+        # plunge, then let go of the piece and go up
+        waypoints.append(self._z_waypoint(0))
+        waypoints.append(self._z_waypoint(home_height, grabber="open"))
+
+        self.run_trajectory(waypoints, suppress_errors=True)
 
         # verify move was successful
         board = self.get_board()
 
-        if board[move[1]][move[0]] or not board[move[3]][move[2]]:
+        if board[move[0:2]] or not board[move[2:4]]:
 
             # go back to waiting position
             position = settings["board-positions"]["home"]["position"]
             self.goto_position(x=position[0], y=position[1], grabber="closed", suppress_errors=True)
 
-            prompt_queue.put((("[app.title]Fix Board", "", "[app.label]Failed to make move,", f"[app.label]please move from {move[0]}{move[1]} to {move[2]}{move[3]}"), {"Ok": None}))
+            self.prompt_queue.put((("[app.title]Fix Board", "", "[app.label]Failed to make move,", f"[app.label]please move from {move[0]}{move[1]} to {move[2]}{move[3]}"), {"Ok": None}))
 
             self.speak(f"Failed to make move, please move from {move[0]}{move[1]} to {move[2]}{move[3]}")
 
             # wait until board is fixed
-            while board[move[1]][move[0]] or not board[move[3]][move[2]] and self.continue_game:
-                board = self.get_board()
+            self.wait_for_board(lambda board: not board[move[0:2]] and board[move[2:4]])
 
     def remove_piece(self, square):
         # pick up piece
-        position = settings["board-positions"][square[1]][square[0]]
-        self.goto_position(x=position[0], y=position[1], suppress_errors=True)
+        waypoints = self._named_arm_waypoints(square)
 
-        # plunge
-        self.goto_position(z=0, grabber="open", suppress_errors=True)
-
-        time.sleep(1.5)
-
-        # go up
-        self.goto_position(z=settings["board-positions"]["home"]["height"], grabber="closed", suppress_errors=True)
-
-        time.sleep(2)
+        # plunge, then go up with the piece
+        waypoints.append(self._z_waypoint(0, grabber="open"))
+        waypoints.append(self._z_waypoint(settings["board-positions"]["home"]["height"], grabber="closed"))
         
         # go back to waiting position
-        position = settings["board-positions"]["home"]["position"]
-        self.goto_position(x=position[0], y=position[1], grabber="closed", suppress_errors=True)
-
-        # drop piece
-        self.goto_position(grabber="open")
+        waypoints += self._named_arm_waypoints("home")
 
-        time.sleep(0.5)
+        # drop piece, then close grabber
+        waypoints.append(self._grabber_waypoint("open", hold=500))
+        waypoints.append(self._grabber_waypoint("closed"))
 
-        # close grabber
-        self.goto_position(grabber="closed")
+        self.run_trajectory(waypoints, suppress_errors=True)
 
         # verify removal was successful
         board = self.get_board()
 
-        if board[square[1]][square[0]]:
+        if board[square]:
 
-            prompt_queue.put((("[app.title]Fix Board", "", "[app.label]Failed to remove piece,", f"[app.label]please remove {square[0]}{square[1]}"), {"Ok": None}))
+            self.prompt_queue.put((("[app.title]Fix Board", "", "[app.label]Failed to remove piece,", f"[app.label]please remove {square[0]}{square[1]}"), {"Ok": None}))
 
             self.speak(f"Failed to remove piece, please remove {square[0]}{square[1]}")
 
             # wait until board is fixed
-            while board[square[1]][square[0]] and self.continue_game:
-                board = self.get_board()
+            self.wait_for_board(lambda board: not board[square])
 
             # countdown timer to allow player to remove hand from board
             self.set_leds("countdown", custom_data={"index": 0}, suppress_errors=True)
@@ -429,24 +925,17 @@ class SerialInterface():
             self.set_leds("making-move")
 
     def speak(self, text: str):
-        global settings
 
         # initialize tts engine
         tts_engine = pyttsx3.Engine()
 
-        try:
-            # load settings file
-            with open('settings.json') as json_file:
-                settings = json.load(json_file)
-        except:
-            pass
+        # pick up changes to the settings file
+        settings.reload()
 
         # executed every time a word is said if talking animation is enabled
+        # mouth positions are merged in the outbound queue, so a backlog never builds up or delays other commands
         def onWord(name, location, length):
 
-            # clear other outbound talking motions
-            self.serial.reset_output_buffer()
-            
             # find word using positioning info
             word = "".join(filter(str.isalpha, text[location:(location + length)])).lower()
             
@@ -485,11 +974,6 @@ class SerialInterface():
         # connect talking animation
         if settings["tts"]["talking-animation"]:
             tts_engine.connect('started-word', onWord)
-            tts_engine.connect('finished-utterance', self.serial.reset_output_buffer)
-
-        else:
-            tts_engine.disconnect('started-word')
-            tts_engine.disconnect('finished-utterance', self.serial.reset_output_buffer)
 
         # set voice
         voices = tts_engine.getProperty('voices')
@@ -520,6 +1004,34 @@ class SerialInterface():
 
         return voice_names
 
+    # waits until the piece on a square is swapped for another one, returns false if any other square changes
+    def _wait_for_swap(self, square: str):
+        prev_snapshot = self.get_board()
+
+        lifted = False
+
+        while self.continue_game:
+
+            # wait for the board to stream a sensor change
+            try:
+                board_snapshot = self.board_events.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            changed = prev_snapshot.diff(board_snapshot)
+            prev_snapshot = board_snapshot
+
+            if changed & ~(1 << square_index(square)):
+                return False
+
+            if not board_snapshot[square]:
+                lifted = True
+
+            elif lifted:
+                return True
+
+        return False
+
     # make sure all pieces are in their starting position, keep prompting user until this happens
     def prepare_board(self):
         
@@ -532,23 +1044,23 @@ class SerialInterface():
             
             is_ready = True
 
-            for row in board_snapshot.keys():
-                for column in board_snapshot[row].keys():
-                    if not board_snapshot[row][column] and (sf.get_what_is_on_square(f"{column}{row}") != None):
+            for row in range(1, 9):
+                for column in "abcdefgh":
+                    if not board_snapshot[f"{column}{row}"] and (self.game_board.piece_at(chess.parse_square(f"{column}{row}")) != None):
                         is_ready = False
 
             if is_ready == False:
-                prompt_queue.put((("[app.title]Prepare Board", "", "[app.label]All pieces must be in their", "[app.label]starting position..."), {"Fixed": self.prepare_board, "End Game": lambda *_: self.game_end(do_exit=False)}))
+                self.prompt_queue.put((("[app.title]Prepare Board", "", "[app.label]All pieces must be in their", "[app.label]starting position..."), {"Fixed": self.prepare_board, "End Game": lambda *_: self.game_end(do_exit=False)}))
 
             self.board_ready = is_ready
 
         else:
-            prompt_queue.put((("[app.title]Not Connected", "", "[app.label]Board was disconnected,", "[app.label]chess game cannot be continued..."), {"End Game": lambda *_: self.game_end(do_exit=False)}))
+            self.prompt_queue.put((("[app.title]Not Connected", "", "[app.label]Board was disconnected,", "[app.label]chess game cannot be continued..."), {"End Game": lambda *_: self.game_end(do_exit=False)}))
 
         
-    # runs the chess game
+    # runs the chess game as a state machine, each state returns the next state and its arguments
+    # states: starting -> waiting <-> moving, waiting/moving -> invalid/outcome -> end
     def game_start(self):
-        global settings, board_visual, wdl_stats
 
         # wait until other game threads are finnished
         while self.continue_game:
@@ -557,16 +1069,50 @@ class SerialInterface():
         # additional delay
         time.sleep(1)
 
-        self.game_state = "starting"
         self.continue_game = True
 
+        states = {"starting": self.game_starting,
+                  "waiting": self.game_waiting,
+                  "moving": self.game_moving,
+                  "invalid": self.game_invalid,
+                  "outcome": self.game_outcome}
+
+        state, arguments = "starting", {}
+
+        while state != "end":
+
+            # the game was ended from somewhere else, finish the current state and stop
+            if not self.continue_game:
+                logger.info("game state %s -> end (game ended)", state)
+                break
+
+            try:
+                next_state, arguments = states[state](**arguments)
+
+            except Exception:
+                logger.exception("game state %s failed", state)
+                next_state, arguments = "end", {}
+
+            logger.info("game state %s -> %s", state, next_state)
+
+            state = next_state
+
+        self.game_end()
+
+    def game_starting(self):
+
+        self.game_state = "starting"
+
         # reset ChatGPT message history
         chatGPT.reset_history()
 
-        # reset stockfish board
-        sf.set_fen_position(settings["game"]["starting-fen"])
-        board_visual = sf.get_board_visual()
-        board_popout_window.update(sf.get_fen_position())
+        # reset the game board
+        self.game_board.set_fen(settings["game"]["starting-fen"])
+        self.board_visual = get_board_text(self.game_board)
+        self.board_popout_window.update(self.game_board.fen())
+
+        # receive sensor changes from the board instead of polling it
+        self.board_events = self.subscribe_board()
 
         # make sure all pieces are in their starting position
         self.prepare_board()
@@ -576,7 +1122,7 @@ class SerialInterface():
             time.sleep(1)
 
         if not self.continue_game:
-            self.game_end()
+            return "end", {}
 
         # used to detect castling
         self.castling_bishop_positions = {"e1g1": "h1f1",
@@ -584,263 +1130,199 @@ class SerialInterface():
                                         "e8g8": "h8f8",
                                         "e8c8": "a8d8"}
 
-        # set stockfish elo/skill level
-        sf.set_elo_rating(settings["game"]["bot-elo"])
+        # set stockfish elo/skill level and search budget
+        self.sf.set_elo(settings["game"]["bot-elo"])
+        self.sf.set_limits(settings["stockfish"]["depth"], settings["stockfish"]["movetime"], settings["stockfish"]["nodes"])
+        self.sf.set_resources(settings["stockfish"]["threads"], settings["stockfish"]["hash"])
 
-        # home z axis
-        self.goto_position(z=0, suppress_errors=True)
+        # load the opening book, the engine plays on its own if there isn't one
+        if self.book != None:
+            self.book.close()
+
+        self.book = opening_book.load(settings["stockfish"]["opening-book"])
 
-        time.sleep(2)
+        # home z axis, each move waits until the board reports it has arrived
+        self.goto_position(z=0, suppress_errors=True)
         
         # raise z axis
         self.goto_position(z=settings["board-positions"]["home"]["height"], suppress_errors=True)
 
-        time.sleep(2)
-
         # goto waiting position
         position = settings["board-positions"]["home"]["position"]
         self.goto_position(x=position[0], y=position[1], grabber="closed", suppress_errors=True)
-        
-        time.sleep(1)
 
         self.speak(chatGPT.get_response("The game has just started. You are waiting on your opponent to make a move."))
         
-        self.game_waiting()
+        return "waiting", {}
 
 
-    def game_waiting(self):
-        global board_visual, wdl_stats, best_moves
+    # called with the search of the starting position started when the session was created
+    def _initial_analysis_done(self, future: Future):
 
-        self.game_state = "waiting"
-
-        self.castling = (False, [""])
-        self.pawn_promotion = (False, [""])
-        self.capture = (False, "")
-
-        board_changes = []
-
-        prev_snapshot = self.get_board(suppress_errors=True)
-
-        # update led wdl stats
-        wdl_stats = sf.get_wdl_stats()
-        self.set_leds("wld-stats", custom_data={"intensity": round(((wdl_stats[0] + (wdl_stats[1] / 2)) * 255) / 1000)}, suppress_errors=True)
-        
-        moves_shown = False
-
-        best_moves = []
-
-        if settings["game"]["top-move-count"] != 0:
-
-            # save top (n) best moves to determine if an insult should be thrown later on
-            for move in sf.get_top_moves(settings["game"]["top-move-count"]):
-                best_moves.append(move["Move"])
-
-        while self.continue_game:
-
-            # get board snapshot
-            board_snapshot = self.get_board(suppress_errors=True)
-
-            # check if board is valid
-            if board_snapshot != None:
-                
-                # store changes compared to previous snapshot
-                for row in board_snapshot.keys():
-                    for square in board_snapshot[row].keys():
-
-                        # if the snapshot squares are not the same save the changes
-                        if board_snapshot[row][square] != prev_snapshot[row][square]:
-                            board_changes.append((f"{square}{row}", board_snapshot[row][square])) # either True or False
-
-                # update previous board snapshot
-                prev_snapshot = board_snapshot
+        if future.cancelled() or future.exception() != None or future.result() == None:
+            return
 
+        # a game that has started keeps its own stats
+        if self.game_state == "inactive":
+            self.wdl_stats = future.result()["wdl"]
 
-                # move input logic ----------------------------------------
+    # shows the search started when waiting for the player's move, runs on the engine service's thread
+    def _analysis_done(self, board: chess.Board, future: Future):
 
-                self.capture = (False, "")
+        if future.cancelled() or future.exception() != None or future.result() == None:
+            return
 
-                if (len(board_changes) == 3):
-                    
-                    move1 = [board_changes[0][0], board_changes[2][0]] # first possibility
-                    move2 = [board_changes[1][0], board_changes[2][0]] # second possibility
-                
-                    # test for a capture move
-                    if not board_changes[0][1] and not board_changes[1][1] and board_changes[2][1] and ((move1[0] == move1[1]) or (move2[0] == move2[1])):
-                        
-                        valid_move = False
+        analysis = future.result()
 
-                        for index in [move1, move2, (move1 + ["q"]), (move2 + ["q"])]:
+        # the player has already moved, the leds belong to the next state
+        if self.game_state != "waiting" or self.game_board.fen() != board.fen():
+            return
 
-                            if sf.is_move_correct("".join(index)):
+        # update led wdl stats
+        self.wdl_stats = analysis["wdl"]
+        self.set_leds("wld-stats", custom_data={"intensity": round(((self.wdl_stats[0] + (self.wdl_stats[1] / 2)) * 255) / 1000)}, suppress_errors=True)
 
-                                valid_move = True
+        # search the bot's reply to the most likely moves while the player thinks
+        if settings["game"]["ponder"] and self.continue_game:
+            self.sf.ponder(board, analysis["top-moves"][:settings["game"]["ponder-move-count"]], settings["game"]["top-move-count"])
 
-                                self.capture = (True, sf.get_what_is_on_square(index[1]))
+    def game_waiting(self):
 
-                                play_sound.play_json_sound("capture")
+        self.game_state = "waiting"
 
-                                # check for pawn promotion then enable it
-                                if ("PAWN" in str(sf.get_what_is_on_square(index[0]))) and (("1" in index[1]) or ("8" in index[1])):
-                                    self.pawn_promotion = (True, index[0:2])
+        self.pawn_promotion = (False, [""])
+        self.capture = (False, "")
 
-                                    # ask user what they would like to promote to
-                                    prompt_queue.put((("[app.title]Pawn Promotion", "", "[app.label]Select promotion type,", "[app.label]then swap out piece."),
-                                                    {"♛  Queen": lambda *_: self.pawn_promotion[1].append("q"), "♝  Bishop": lambda *_: self.pawn_promotion[1].append("b"), "♞  Knight": lambda *_: self.pawn_promotion[1].append("n"), "♜  Rook": lambda *_: self.pawn_promotion[1].append("r")}))
+        # legal moves of this position keyed by the sensor changes they cause
+        move_index = MoveIndex(self.game_board)
 
-                                else:
-                                    # make move
-                                    sf.make_moves_from_current_position(["".join(index)])
-                                    board_visual = sf.get_board_visual()
+        # every square that changed since the start of the move
+        touched = 0
 
-                                    # update board popout window
-                                    board_popout_window.update(sf.get_fen_position(), lastmove="".join(index))
-                                
-                                    self.game_moving(lastmove="".join(index))
+        # drop sensor changes streamed while the robot was busy
+        while not self.board_events.empty():
+            self.board_events.get_nowait()
 
-                                board_changes = []
-                                break
+        prev_snapshot = self.get_board(suppress_errors=True)
+        start_snapshot = prev_snapshot
 
-                        if not valid_move:
-                            self.game_invalid()
+        # one search gives the wdl stats, the top moves and the likely replies to ponder
+        # it runs while the player's move is being read, game_moving waits on it for the top moves
+        self.analysis = self.sf.analyse(self.game_board, max(settings["game"]["top-move-count"], settings["game"]["ponder-move-count"]))
+        self.analysis.add_done_callback(functools.partial(self._analysis_done, self.game_board.copy()))
 
-                    else:
-                        self.game_invalid()
+        moves_shown = False
 
-                elif (len(board_changes) == 2):
+        # set while a rook move waits to see if the king follows it to castle
+        castling_deadline = None
 
-                    move1 = [board_changes[0][0], board_changes[1][0]] # first possibility
-                    move2 = [board_changes[1][0], board_changes[0][0]] # second possibility
-                    
-                    # test if castling is enabled
-                    if self.castling[0]:
-                        if "".join(move1) == self.castling_bishop_positions["".join(self.castling[1])]:
+        while self.continue_game:
 
-                            self.castling = (False, [""])
+            settled = False
 
-                            self.game_moving(lastmove="".join(index))
+            # wait for the board to stream a sensor change
+            try:
+                board_snapshot = self.board_events.get(timeout=1 if castling_deadline == None else max(0.01, castling_deadline - time.monotonic()))
+            except queue.Empty:
+                board_snapshot = None
 
-                        else:
-                            self.game_invalid()
+                # the king didn't follow, look at the rook move again and take it as it is
+                if castling_deadline != None and time.monotonic() >= castling_deadline:
+                    board_snapshot = prev_snapshot
+                    settled = True
 
-                    # test if pawn promotion is enabled
-                    elif self.pawn_promotion[0]:
+            # check if board is valid
+            if board_snapshot != None:
 
-                        # wait until piece modifier is added
-                        if len(self.pawn_promotion[1]) == 3:
+                castling_deadline = None
 
-                            # make move
-                            sf.make_moves_from_current_position(["".join(self.pawn_promotion[1])])
+                # store every square that changed since the start of the move
+                touched |= prev_snapshot.diff(board_snapshot)
 
-                            # make sure no other moves are being made
-                            for index in board_changes:
-                                if (index[0] != self.pawn_promotion[1][1]):
+                # update previous board snapshot
+                prev_snapshot = board_snapshot
 
-                                    self.game_invalid()
+                diff = start_snapshot.diff(board_snapshot)
 
-                            board_visual = sf.get_board_visual()
+                # move input logic ----------------------------------------
 
-                            # update board popout window
-                            board_popout_window.update(sf.get_fen_position(), lastmove="".join(self.pawn_promotion[1]))
+                moves = move_index.lookup(touched, diff)
 
-                            self.pawn_promotion = (False, [""])
+                # a rook on its castling square can be the first half of castling, give the king time to move
+                if moves and not settled and move_index.is_castling_prefix(touched, diff):
+                    castling_deadline = time.monotonic() + settings["game"]["castling-settle-time"]
+                    moves = []
 
-                            self.game_moving(lastmove="".join(index))
+                # every piece is back where it started
+                if diff == 0:
 
-                        else:
-                            self.game_invalid()
+                    if moves_shown:
+                        # hide possible moves for that piece
+                        self.board_popout_window.update(self.game_board.fen())
 
-                    # test for the precursor to a capture move
-                    elif not board_changes[0][1] and not board_changes[1][1]:
-                        
-                        valid_move = False
+                        moves_shown = False
 
-                        for index in [move1, move2, (move1 + ["q"]), (move2 + ["q"])]:
+                    touched = 0
 
-                            if sf.is_move_correct("".join(index)) and (str(sf.will_move_be_a_capture("".join(index))) != sf.Capture.NO_CAPTURE):
-                                valid_move = True
-                                break
+                elif moves:
+                    move = moves[0]
 
-                        if not valid_move:
-                            self.game_invalid()
+                    # the same changes match every promotion type, ask the user which one they want
+                    if move.promotion != None:
+                        self.pawn_promotion = (True, [chess.square_name(move.from_square), chess.square_name(move.to_square)])
 
-                    # test for a normal move
-                    elif not board_changes[0][1] and board_changes[1][1]:
+                        # ask user what they would like to promote to
+                        self.prompt_queue.put((("[app.title]Pawn Promotion", "", "[app.label]Select promotion type,", "[app.label]then swap out piece."),
+                                        {"♛  Queen": lambda *_: self.pawn_promotion[1].append("q"), "♝  Bishop": lambda *_: self.pawn_promotion[1].append("b"), "♞  Knight": lambda *_: self.pawn_promotion[1].append("n"), "♜  Rook": lambda *_: self.pawn_promotion[1].append("r")}))
                         
-                        valid_move = False
-
-                        for index in [move1, (move1 + ["q"])]:
-                            if sf.is_move_correct("".join(index)):
-
-                                valid_move = True
-                                
-                                # check for castling then enable it
-                                if ("".join(index) in self.castling_bishop_positions.keys()) and ("KING" in str(sf.get_what_is_on_square(index[0]))):
-                                    self.castling = (True, index[0:2])
-
-                                    # make move
-                                    sf.make_moves_from_current_position(["".join(index)])
-                                    board_visual = sf.get_board_visual()
+                        self.speak("Select what you would like to promote to on the computer, then swap out the piece.")
 
-                                    # update board popout window
-                                    board_popout_window.update(sf.get_fen_position(), lastmove="".join(index))
+                        # wait until promotion type is specified
+                        while len(self.pawn_promotion[1]) != 3 and self.continue_game:
+                            time.sleep(0.5)
 
-                                # check for pawn promotion then enable it
-                                elif ("PAWN" in str(sf.get_what_is_on_square(index[0]))) and (("1" in index[1]) or ("8" in index[1])):
-                                    self.pawn_promotion = (True, index[0:2])
+                        if not self.continue_game:
+                            return "end", {}
 
-                                    # ask user what they would like to promote to
-                                    prompt_queue.put((("[app.title]Pawn Promotion", "", "[app.label]Select promotion type,", "[app.label]then swap out piece."),
-                                                    {"♛  Queen": lambda *_: self.pawn_promotion[1].append("q"), "♝  Bishop": lambda *_: self.pawn_promotion[1].append("b"), "♞  Knight": lambda *_: self.pawn_promotion[1].append("n"), "♜  Rook": lambda *_: self.pawn_promotion[1].append("r")}))
-                                    
-                                    self.speak("Select what you would like to promote to on the computer, then swap out the piece.")
-
-                                else:
-                                    play_sound.play_json_sound("move")
-
-                                    # make move
-                                    sf.make_moves_from_current_position(["".join(index)])
-                                    board_visual = sf.get_board_visual()
-
-                                    # update board popout window
-                                    board_popout_window.update(sf.get_fen_position(), lastmove="".join(index))
-
-                                    self.game_moving(lastmove="".join(index))
+                        # make sure no other moves are being made
+                        if not self._wait_for_swap(self.pawn_promotion[1][1]):
+                            return "invalid", {}
 
+                        move = chess.Move.from_uci("".join(self.pawn_promotion[1]))
 
-                            # check if piece didn't move position
-                            elif index[0] == index[1]:
-                                valid_move = True
+                        self.pawn_promotion = (False, [""])
 
-                                # hide possible moves for that piece
-                                board_popout_window.update(sf.get_fen_position())
+                    if self.game_board.is_capture(move):
+                        self.capture = (True, self.game_board.piece_at(move.to_square))
 
-                                moves_shown = False
+                        play_sound.play_json_sound("capture")
 
-                                board_changes = []
+                    else:
+                        play_sound.play_json_sound("move")
 
-                        if not valid_move:
-                            self.game_invalid()
+                    # make move
+                    self.game_board.push(move)
+                    self.board_visual = get_board_text(self.game_board)
 
-                    else:
-                        self.game_invalid()
+                    # update board popout window
+                    self.board_popout_window.update(self.game_board.fen(), lastmove=move.uci())
 
+                    return "moving", {"lastmove": move.uci()}
 
-                elif (len(board_changes) == 1) and not board_changes[0][1]:
+                # the changes can still become a legal move, keep waiting
+                elif move_index.is_partial(touched):
 
-                    if not moves_shown:
+                    # a single piece was lifted
+                    if (diff == touched) and (popcount(touched) == 1) and not moves_shown:
                         # show possible moves on popout window
                         # run it in a seperate thread
-                        t = continuous_threading.Thread(board_popout_window.update, args=(sf.get_fen_position(), None, None, board_changes[0][0]))
+                        t = continuous_threading.Thread(self.board_popout_window.update, args=(self.game_board.fen(), None, None, mask_squares(touched)[0]))
                         t.start()
 
                         moves_shown = True
 
-                elif len(board_changes) == 0:
-                    pass # do nothing
-
                 else:
-
-                    self.game_invalid()
+                    return "invalid", {}
 
             # update connection status
             self.check_connection()
@@ -850,22 +1332,15 @@ class SerialInterface():
                 self.continue_game = False
 
                 # notify user why game was stopped
-                prompt_queue.put((("[app.title]Not Connected", "", "[app.label]Game has been ended,", "[app.label]chess robot not connected..."), {"Ok": None}))
+                self.prompt_queue.put((("[app.title]Not Connected", "", "[app.label]Game has been ended,", "[app.label]chess robot not connected..."), {"Ok": None}))
 
-
-
-        # execution was terminated close the thread
-        self.game_end()
+        # execution was terminated
+        return "end", {}
 
     def game_moving(self, lastmove):
-        global settings, board_visual
 
-        try:
-            # load settings file
-            with open('settings.json') as json_file:
-                settings = json.load(json_file)
-        except:
-            pass 
+        # pick up changes to the settings file
+        settings.reload()
         
         try:
             # stop the alert sound if playing
@@ -882,44 +1357,64 @@ class SerialInterface():
 
         self.game_state = "moving"
 
-        # use another library to get info about the game
-        board = chess.Board(sf.get_fen_position())
-
-        outcome = board.outcome()
+        outcome = self.game_board.outcome()
 
         # detect checkmate, stalemate, etc
         if outcome != None:
             
-            self.game_outcome(outcome)
+            return "outcome", {"outcome": outcome}
 
         # detect check for bots side
-        elif board.is_check():
+        elif self.game_board.is_check():
 
-            king_square = board.king(chess.BLACK)
+            king_square = self.game_board.king(chess.BLACK)
 
             # show the king is in check on the board visual popout
-            board_popout_window.update(sf.get_fen_position(), check=chess.square_name(king_square))
+            self.board_popout_window.update(self.game_board.fen(), check=chess.square_name(king_square))
 
         self.capture = (False, "")
 
-        # insult the player if they made a bad move
-        if not lastmove in best_moves:
+        # insult the player if they made a bad move, the top (n) best moves come from the search started while waiting
+        try:
+            analysis = self.analysis.result()
+        except CancelledError:
+            analysis = None
+
+        if analysis != None and not lastmove in analysis["top-moves"][:settings["game"]["top-move-count"]]:
             self.speak(chatGPT.get_response(f"Your opponent has just made a bad move from {lastmove}"))
 
-        # generate the best move using stockfish
-        sf_move = sf.get_best_move()
+        # play from the opening book while the game is still in it
+        sf_move = self.book.choose(self.game_board, settings["game"]["bot-elo"]) if self.book != None else None
+
+        # generate the best move using stockfish, game_end stops the search
+        if sf_move == None:
+            try:
+                sf_move = self.sf.best_move(self.game_board, settings["game"]["top-move-count"]).result()
+            except CancelledError:
+                sf_move = None
+
+            if sf_move == None:
+                return "end", {}
+
+        move = chess.Move.from_uci(sf_move)
             
         #check for capture
-        if sf.get_what_is_on_square(sf_move[2:4]) != None:
+        if self.game_board.is_capture(move):
 
-            self.capture = (True, sf.get_what_is_on_square(sf_move[2:4]))
+            # an en passant capture takes the pawn beside the target square
+            if self.game_board.is_en_passant(move):
+                captured_square = chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square))
+            else:
+                captured_square = move.to_square
+
+            self.capture = (True, self.game_board.piece_at(captured_square))
 
-            self.remove_piece(sf_move[2:4])
+            self.remove_piece(chess.square_name(captured_square))
 
         self.make_move(sf_move)
         
         # check for castling
-        if (sf_move in self.castling_bishop_positions.keys()) and ("KING" in str(sf.get_what_is_on_square(sf_move[0:2]))):
+        if self.game_board.is_castling(move):
             
             self.make_move(self.castling_bishop_positions[sf_move])
 
@@ -931,13 +1426,13 @@ class SerialInterface():
         if len(sf_move) == 5:
             self.pawn_promotion = (True, [sf_move[0:2], sf_move[2:4]])
             
-            prompt_queue.put((("[app.title]Pawn Promotion", "", "[app.label]Select promotion type,", "[app.label]then swap out piece."),
+            self.prompt_queue.put((("[app.title]Pawn Promotion", "", "[app.label]Select promotion type,", "[app.label]then swap out piece."),
                 {"♛  Queen": lambda *_: self.pawn_promotion[1].append("q"), "♝  Bishop": lambda *_: self.pawn_promotion[1].append("b"), "♞  Knight": lambda *_: self.pawn_promotion[1].append("n"), "♜  Rook": lambda *_: self.pawn_promotion[1].append("r")}))
             
             self.speak("Select what you want my promotion to be on the computer, then swap out the piece.")
             
             # wait until promotion type is specified
-            while len(self.pawn_promotion[1]) != 3:
+            while len(self.pawn_promotion[1]) != 3 and self.continue_game:
 
                 time.sleep(0.5)
 
@@ -947,19 +1442,17 @@ class SerialInterface():
 
             # wait until piece is swapped out
             while self.pawn_promotion[0] and self.continue_game:
-                # get board snapshot
-                board_snapshot = self.get_board()
+                # wait for the board to stream a sensor change
+                try:
+                    board_snapshot = self.board_events.get(timeout=1)
+                except queue.Empty:
+                    board_snapshot = None
 
                 # check if board is valid
                 if board_snapshot != None:
                     
-                    # store changes compared to previous snapshot
-                    for row in board_snapshot.keys():
-                        for square in board_snapshot[row].keys():
-
-                            # if the snapshot squares are not the same save the changes
-                            if board_snapshot[row][square] != prev_snapshot[row][square]:
-                                board_changes.append((f"{square}{row}", board_snapshot[row][square])) # either True or False
+                    # store changes compared to previous snapshot, either True or False for each changed square
+                    board_changes += prev_snapshot.changes(board_snapshot)
 
                     if len(board_changes) > 1:
                     
@@ -967,7 +1460,7 @@ class SerialInterface():
                         for index in board_changes:
                             if (index[0] != self.pawn_promotion[1][1]):
 
-                                self.game_invalid()
+                                return "invalid", {}
 
                         board_changes = []
                         
@@ -976,16 +1469,15 @@ class SerialInterface():
 
                     prev_snapshot = board_snapshot
 
+            if not self.continue_game:
+                return "end", {}
 
-        sf.make_moves_from_current_position([sf_move])
-
-        board_visual = sf.get_board_visual()
+        self.game_board.push_uci(sf_move)
 
-        # update board visual popout
-        board_popout_window.update(sf.get_fen_position())
+        self.board_visual = get_board_text(self.game_board)
 
         # update board popout window
-        board_popout_window.update(sf.get_fen_position(), lastmove=sf_move)
+        self.board_popout_window.update(self.game_board.fen(), lastmove=sf_move)
 
         # play sound effects
         if self.capture[0]:
@@ -994,23 +1486,20 @@ class SerialInterface():
         else:
             play_sound.play_json_sound("move")
 
-        # use another library to get info about the game
-        board = chess.Board(sf.get_fen_position())
-
-        outcome = board.outcome()
+        outcome = self.game_board.outcome()
 
         # detect checkmate, stalemate, etc
         if outcome != None:
             
-            self.game_outcome(outcome)
+            return "outcome", {"outcome": outcome}
 
         # detect check for bots side
-        elif board.is_check():
+        elif self.game_board.is_check():
 
-            king_square = board.king(chess.WHITE)
+            king_square = self.game_board.king(chess.WHITE)
 
             # show the king is in check on the board visual popout
-            board_popout_window.update(sf.get_fen_position(), check=chess.square_name(king_square))
+            self.board_popout_window.update(self.game_board.fen(), check=chess.square_name(king_square))
 
             # used to play an alert sound when in check
             self.check_alert_thread = continuous_threading.ContinuousThread(play_sound.play_json_sound, args=("check-alert", True,))
@@ -1018,7 +1507,7 @@ class SerialInterface():
             self.check_alert_thread.start()
             
         # switch to waiting for move
-        self.game_waiting()
+        return "waiting", {}
 
 
     def game_invalid(self):
@@ -1030,12 +1519,8 @@ class SerialInterface():
         except:
             pass
 
-        try:
-            # load settings file
-            with open('settings.json') as json_file:
-                settings = json.load(json_file)
-        except:
-            pass 
+        # pick up changes to the settings file
+        settings.reload()
 
         # do animations
         self.set_leds("invalid")
@@ -1044,30 +1529,28 @@ class SerialInterface():
 
         #----------------------- clear the board
 
-        # home z axis
+        # home z axis, each move waits until the board reports it has arrived
         self.goto_position(z=0)
 
-        time.sleep(1.5)
-
         # go to height
         self.goto_position(z=settings["board-positions"]["clear"]["height"], grabber="open")
 
-        time.sleep(1)
+        # go through clearing sequence, the positions are in the ik table as "clear-0", "clear-1", ...
+        waypoints = []
+
+        for index in range(len(settings["board-positions"]["clear"]["sequence"])):
+            waypoints += self._named_arm_waypoints(f"clear-{index}")
 
-        # go through clearing sequence
-        for index in settings["board-positions"]["clear"]["sequence"]:
-            self.goto_position(x=index[0], y=index[1])
-            time.sleep(0.5)
+        self.run_trajectory(waypoints)
 
         # go back up again
         self.goto_position(z=settings["board-positions"]["home"]["height"])
-        time.sleep(1)
 
         # goto waiting position
         position = settings["board-positions"]["home"]["position"]
         self.goto_position(x=position[0], y=position[1], grabber="closed", suppress_errors=True)
 
-        self.game_end()
+        return "end", {}
 
     def game_outcome(self, outcome):
         
@@ -1091,16 +1574,38 @@ class SerialInterface():
 
             self.speak(chatGPT.get_response("You put your opponent in check, you won. Speak 4 sentences."))
 
-        self.game_end()
-
+        return "end", {}
 
+    # stops the game, the game thread finishes its current state then calls this with do_exit to reset the robot to idle
     def game_end(self, do_exit:bool = True):
         self.continue_game = False
 
+        # stop the running search and searching replies in the background
+        if stockfish_ready:
+            self.sf.stop()
+
+        # stop the sensor stream used by the game
+        try:
+            self.unsubscribe_board(self.board_events)
+        except:
+            pass
+
         if do_exit:
             self.game_state = "inactive"
 
             self.set_leds("idle")
 
-            exit()
-    
+    # ends the game, releases the serial port and stops the session's threads
+    def close(self):
+        self.game_end(do_exit=False)
+
+        self.closed = True
+
+        if self.sf != None:
+            self.sf.close()
+
+        with self._outbound_ready:
+            self._outbound_ready.notify_all()
+
+        if self.serial.is_open:
+            self.serial.close()
@@ -0,0 +1,591 @@
+import subprocess
+import collections
+import threading
+import ctypes
+import os
+import functools
+from concurrent.futures import Future
+from analysis_cache import normalize_fen
+
+try:
+    import chess
+    import chess.engine
+except:
+    subprocess.run(["pip", "install", "chess"])
+    import chess
+    import chess.engine
+
+
+# uci chess engine used for searching positions, the game state itself lives in a chess.Board
+class Engine():
+
+    # search limits and resources are described in set_limits and set_resources
+    # analysis_cache is an optional AnalysisCache that keeps results on disk between games
+    # tablebase is an optional Tablebase that answers endgames exactly without searching
+    def __init__(self, path: str, depth: int=15, movetime: int=0, nodes: int=0, threads="auto", hash_size="auto",
+                 cache_size: int=256, analysis_cache=None, tablebase=None):
+        self.engine = chess.engine.SimpleEngine.popen_uci(path)
+
+        # identifies the engine in the disk cache, results of other versions aren't reused
+        self.name = self.engine.id.get("name", path)
+
+        self.elo = None
+
+        # analysis results keyed by (normalized fen, elo, search limits, top move count), oldest entries are dropped first
+        self.cache = collections.OrderedDict()
+        self.cache_size = cache_size
+        self.analysis_cache = analysis_cache
+        self.tablebase = tablebase
+
+        # held while the engine is searching
+        self._lock = threading.Lock()
+
+        # guards the cache and the running search below
+        self._state_lock = threading.Lock()
+
+        # the search currently running, {"key", "analysis", "aborted"}
+        self._searching = None
+
+        # report win/draw/loss stats with every search if the engine supports it
+        if "UCI_ShowWDL" in self.engine.options:
+            self.engine.configure({"UCI_ShowWDL": True})
+
+        # let the engine use the tablebases inside its own searches too
+        if tablebase != None and "SyzygyPath" in self.engine.options:
+            self.engine.configure({"SyzygyPath": tablebase.path})
+
+        self.set_limits(depth, movetime, nodes)
+        self.set_resources(threads, hash_size)
+
+    # sets how long every search runs, a value of 0 disables that limit, the search stops at the first limit reached
+    # depth in plies, movetime in milliseconds, nodes in searched positions
+    def set_limits(self, depth: int=15, movetime: int=0, nodes: int=0):
+        depth = int(depth or 0)
+        movetime = int(movetime or 0)
+        nodes = int(nodes or 0)
+
+        # never search forever
+        if not (depth or movetime or nodes):
+            depth = 15
+
+        self.limit = chess.engine.Limit(depth=depth or None, time=(movetime / 1000) or None, nodes=nodes or None)
+
+        # describes the limits in cache keys, results of different budgets aren't mixed up
+        self.search = f"depth {depth} movetime {movetime} nodes {nodes}"
+
+    # sets the engine's threads and hash table size in megabytes, "auto" sizes them from the cpu count and free memory
+    def set_resources(self, threads="auto", hash_size="auto"):
+        options = {}
+
+        if "Threads" in self.engine.options:
+            option = self.engine.options["Threads"]
+
+            if threads == "auto":
+                threads = auto_threads()
+
+            options["Threads"] = min(max(int(threads), option.min), option.max)
+
+        if "Hash" in self.engine.options:
+            option = self.engine.options["Hash"]
+
+            if hash_size == "auto":
+                hash_size = auto_hash_size()
+
+            options["Hash"] = min(max(int(hash_size), option.min), option.max)
+
+        # the engine can't be configured mid search
+        with self._lock:
+            self.engine.configure(options)
+
+        self.threads = options.get("Threads")
+        self.hash_size = options.get("Hash")
+
+    # limits the engine's strength to an elo rating, clamped to what the engine supports, None plays at full strength
+    def set_elo(self, elo: int):
+        if elo == None:
+            if self.elo != None:
+                self.engine.configure({"UCI_LimitStrength": False})
+
+            self.elo = None
+
+            return
+
+        option = self.engine.options["UCI_Elo"]
+
+        elo = min(max(int(elo), option.min), option.max)
+
+        if elo == self.elo:
+            return
+
+        self.elo = elo
+
+        self.engine.configure({"UCI_LimitStrength": True, "UCI_Elo": self.elo})
+
+    # searches a position once with multipv, returns a dictionary with:
+    #   best-move - move the engine would play at its current strength, None if the game is over
+    #   top-moves - full strength best moves of the side to move, best first
+    #   wdl       - [win, draw, loss] per mille from white's perspective
+    # returns None if the search was stopped
+    def analyse(self, board: chess.Board, top_move_count: int=1):
+
+        # endgames in the tablebases are answered exactly
+        if self.tablebase != None:
+            result = self.tablebase.probe(board, top_move_count)
+
+            if result != None:
+                return result
+
+        key = self._key(board, top_move_count)
+
+        with self._state_lock:
+            result = self._cached(key)
+
+            if result != None:
+                return result
+
+        return self._search(board, key, top_move_count)
+
+    # aborts the running search, the aborted analyse call returns None
+    def stop(self):
+        with self._state_lock:
+            if self._searching != None:
+                self._searching["aborted"] = True
+                self._searching["analysis"].stop()
+
+    # returns the cache key of a search
+    def _key(self, board: chess.Board, top_move_count: int):
+        return (normalize_fen(board.fen()), self.elo, self.search, max(1, top_move_count))
+
+    # returns a cached result from memory or disk, None if the position hasn't been searched
+    # must be called with the state lock held
+    def _cached(self, key: tuple):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+
+            return self.cache[key]
+
+        if self.analysis_cache != None:
+            fen, elo, search, multipv = key
+
+            result = self.analysis_cache.get(fen, self.name, elo, search, multipv)
+
+            if result != None:
+                self._remember(key, result)
+
+            return result
+
+        return None
+
+    # stores a result in the memory cache, must be called with the state lock held
+    def _remember(self, key: tuple, result: dict):
+        self.cache[key] = result
+
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    # runs a search and caches it, returns None if it was aborted
+    def _search(self, board: chess.Board, key: tuple, top_move_count: int):
+        with self._lock:
+            with self._state_lock:
+                # answered while waiting for the engine
+                result = self._cached(key)
+
+                if result != None:
+                    return result
+
+            with self.engine.analysis(board, self.limit, multipv=max(1, top_move_count)) as analysis:
+                search = {"key": key, "analysis": analysis, "aborted": False}
+
+                with self._state_lock:
+                    self._searching = search
+
+                best = analysis.wait()
+
+            with self._state_lock:
+                self._searching = None
+
+                if search["aborted"]:
+                    return None
+
+                lines = [info for info in analysis.multipv if "pv" in info]
+
+                result = {"best-move": best.move.uci() if best.move != None else None,
+                          "top-moves": [info["pv"][0].uci() for info in lines][:top_move_count],
+                          "wdl": _get_wdl(analysis.multipv[0] if analysis.multipv else {})}
+
+                self._remember(key, result)
+
+            if self.analysis_cache != None:
+                fen, elo, search, multipv = key
+
+                self.analysis_cache.put(fen, self.name, elo, search, multipv, result)
+
+        return result
+
+    def quit(self):
+        self.stop()
+
+        if self.analysis_cache != None:
+            self.analysis_cache.close()
+
+        if self.tablebase != None:
+            self.tablebase.close()
+
+        try:
+            self.engine.quit()
+        except chess.engine.EngineTerminatedError:
+            pass
+
+# a fixed set of warm engine processes shared by game sessions and analysis jobs
+# every process is only ever used by its own worker thread, requests are answered with concurrent.futures.Future objects
+# so the game thread keeps reading sensors and driving leds while a search runs, asyncio code can await them with asyncio.wrap_future
+# sessions take turns, a long batch of analysis can't starve a robot waiting for its move
+class EnginePool():
+
+    # size is the number of engine processes, "auto" sizes it from the cpu count
+    # threads and hash_size are per process, "auto" splits the free cores and memory between the processes
+    # the other arguments are passed to every Engine, the analysis cache and tablebase are shared
+    def __init__(self, path: str, size="auto", depth: int=15, movetime: int=0, nodes: int=0, threads="auto", hash_size="auto",
+                 analysis_cache=None, tablebase=None):
+        if size == "auto":
+            size = auto_pool_size()
+
+        self.size = max(1, int(size))
+        self.limits = (depth, movetime, nodes)
+
+        self.engines = [Engine(path, depth, movetime, nodes, 1, 16, analysis_cache=analysis_cache, tablebase=tablebase)
+                        for _ in range(self.size)]
+
+        self.set_resources(threads, hash_size)
+
+        self._condition = threading.Condition()
+        self._running = True
+
+        # sessions in the order they take turns, _turn is the index of the next one
+        self._sessions = []
+        self._turn = 0
+
+        # job each engine is running, None while idle
+        self._running_jobs = [None] * self.size
+
+        self._workers = [threading.Thread(target=self._run, args=(index,), daemon=True) for index in range(self.size)]
+
+        for worker in self._workers:
+            worker.start()
+
+    # returns a new session, positions and options of one session never leak into another
+    def session(self, name: str="session"):
+        session = EngineSession(self, name)
+
+        with self._condition:
+            self._sessions.append(session)
+
+        return session
+
+    # sets the threads and hash table size of every process, applied before each process' next search
+    def set_resources(self, threads="auto", hash_size="auto"):
+        if threads == "auto":
+            threads = max(1, auto_threads() // self.size)
+
+        if hash_size == "auto":
+            hash_size = max(16, auto_hash_size() // self.size)
+
+        self.resources = (threads, hash_size)
+
+    # stops every session, closes the engines and waits for the workers to finish
+    def quit(self):
+        with self._condition:
+            if not self._running:
+                return
+
+            sessions = list(self._sessions)
+
+        for session in sessions:
+            session.close()
+
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+        for worker in self._workers:
+            worker.join()
+
+        for engine in self.engines:
+            engine.quit()
+
+    # queues a job for a session, must be called with the condition held
+    def _submit(self, session, job: dict):
+        if not self._running:
+            raise chess.engine.EngineTerminatedError("engine pool has quit")
+
+        if job["ponder"]:
+            session._pondering.append(job)
+        else:
+            # the pre-search of this position is already running, wait for it instead of searching it again
+            for running in self._running_jobs:
+                if running != None and running["ponder"] and running["key"] == job["key"]:
+                    session._waiting.append(job)
+                    running["future"].add_done_callback(functools.partial(self._ponder_done, job))
+
+                    return
+
+            session._requests.append(job)
+
+            # a search someone is waiting on goes before pondering, abort a pre-search if every engine is busy
+            if None not in self._running_jobs:
+                for index, running in enumerate(self._running_jobs):
+                    if running["ponder"]:
+                        self.engines[index].stop()
+                        break
+
+        self._condition.notify()
+
+    # answers a job that waited on a pre-search of its position, the job is queued if the pre-search was aborted
+    def _ponder_done(self, job: dict, ponder_future: Future):
+        with self._condition:
+            session = job["session"]
+
+            # stopped while waiting
+            if not any(item is job for item in session._waiting):
+                return
+
+            session._waiting = [item for item in session._waiting if item is not job]
+
+            analysis = None
+
+            if not ponder_future.cancelled() and ponder_future.exception() == None:
+                analysis = ponder_future.result()
+
+            if analysis == None:
+                session._requests.appendleft(job)
+                self._condition.notify()
+
+                return
+
+        if job["future"].set_running_or_notify_cancel():
+            job["future"].set_result(_job_result(job, analysis))
+
+    # returns the next job, sessions take turns and pondering only runs when nothing else is waiting
+    # must be called with the condition held
+    def _next_job(self):
+        for queue_name in ("_requests", "_pondering"):
+            for offset in range(len(self._sessions)):
+                index = (self._turn + offset) % len(self._sessions)
+                jobs = getattr(self._sessions[index], queue_name)
+
+                if jobs:
+                    self._turn = index + 1
+
+                    return jobs.popleft()
+
+        return None
+
+    def _run(self, index: int):
+        engine = self.engines[index]
+        resources = None
+
+        while True:
+            with self._condition:
+                job = self._next_job()
+
+                while job == None and self._running:
+                    self._condition.wait()
+
+                    job = self._next_job()
+
+                if job == None:
+                    return
+
+                self._running_jobs[index] = job
+
+            # cancelled while queued
+            if job["future"].set_running_or_notify_cancel():
+                try:
+                    if resources != self.resources:
+                        resources = self.resources
+                        engine.set_resources(*resources)
+
+                    engine.set_elo(job["elo"])
+                    engine.set_limits(*job["limits"])
+
+                    job["future"].set_result(_job_result(job, engine.analyse(job["board"], job["top-move-count"])))
+
+                except Exception as error:
+                    job["future"].set_exception(error)
+
+            with self._condition:
+                self._running_jobs[index] = None
+
+# one user of an EnginePool, example: a robot's game or a batch of offline analysis
+# options set on a session only apply to its own searches, requests are answered in order per session
+class EngineSession():
+
+    def __init__(self, pool: EnginePool, name: str):
+        self.pool = pool
+        self.name = name
+
+        self.elo = None
+        self.limits = pool.limits
+
+        # jobs waiting for an engine, pondering only runs when no session is waiting on a search
+        self._requests = collections.deque()
+        self._pondering = collections.deque()
+
+        # requests answered by a pre-search of the same position that is already running
+        self._waiting = []
+
+    # future of Engine.analyse, the board is copied so the caller can keep playing on it
+    def analyse(self, board: chess.Board, top_move_count: int=1):
+        return self._submit(board.copy(), top_move_count)
+
+    # future of the move the engine would play in uci form, None if the game is over or the search was stopped
+    def best_move(self, board: chess.Board, top_move_count: int=1):
+        return self._submit(board.copy(), top_move_count, best_move=True)
+
+    # searches the positions after each move when engines are free so later searches are answered from the cache
+    # any previous ponder run of this session is stopped first
+    def ponder(self, board: chess.Board, moves: list, top_move_count: int=1):
+        self.stop_pondering()
+
+        for move in moves:
+            next_board = board.copy()
+            next_board.push_uci(move)
+
+            self._submit(next_board, top_move_count, ponder=True)
+
+    # limits the strength of this session's searches, None plays at full strength
+    def set_elo(self, elo: int):
+        self.elo = elo
+
+    # sets the search limits of this session's searches, see Engine.set_limits
+    def set_limits(self, depth: int=15, movetime: int=0, nodes: int=0):
+        self.limits = (depth, movetime, nodes)
+
+    # processes are shared, so this sets the resources of the whole pool
+    def set_resources(self, threads="auto", hash_size="auto"):
+        self.pool.set_resources(threads, hash_size)
+
+    # cancels this session's queued requests and aborts its running searches
+    # the future of an aborted search resolves to None, cancelled futures raise CancelledError
+    def stop(self):
+        self._stop(pondering_only=False)
+
+    def stop_pondering(self):
+        self._stop(pondering_only=True)
+
+    # stops the session and removes it from the pool
+    def close(self):
+        self.stop()
+
+        with self.pool._condition:
+            if self in self.pool._sessions:
+                self.pool._sessions.remove(self)
+
+    # same as close, lets a session stand in for a single engine
+    def quit(self):
+        self.close()
+
+    def _submit(self, board: chess.Board, top_move_count: int, best_move: bool=False, ponder: bool=False):
+        job = {"future": Future(), "board": board, "top-move-count": top_move_count, "best-move": best_move, "ponder": ponder,
+               "elo": self.elo, "limits": self.limits, "session": self,
+               "key": (normalize_fen(board.fen()), self.elo, self.limits, max(1, top_move_count))}
+
+        with self.pool._condition:
+            self.pool._submit(self, job)
+
+        return job["future"]
+
+    def _stop(self, pondering_only: bool):
+        with self.pool._condition:
+            pending = list(self._pondering)
+            self._pondering.clear()
+
+            if not pondering_only:
+                pending.extend(self._requests)
+                self._requests.clear()
+
+                pending.extend(self._waiting)
+                self._waiting = []
+
+            for index, running in enumerate(self.pool._running_jobs):
+                if running != None and running["session"] is self and (running["ponder"] or not pondering_only):
+                    self.pool.engines[index].stop()
+
+        for job in pending:
+            job["future"].cancel()
+
+# returns what a job's future resolves to, the move alone for best_move requests
+def _job_result(job: dict, analysis: dict):
+    if job["best-move"]:
+        return analysis["best-move"] if analysis != None else None
+
+    return analysis
+
+# returns a process count for an EnginePool, one for every two free cores so each search still gets more than one thread
+def auto_pool_size():
+    return max(1, auto_threads() // 2)
+
+# returns a thread count leaving one core free for the rest of the program
+def auto_threads():
+    return max(1, (os.cpu_count() or 1) - 1)
+
+# returns a hash table size in megabytes, an eighth of the free memory rounded down to a power of two
+def auto_hash_size():
+    free = free_memory()
+
+    if free == None:
+        return 16
+
+    size = 16
+
+    while size * 2 <= min(free // 8, 2048):
+        size *= 2
+
+    return size
+
+# returns the free memory in megabytes, None if it can't be found
+def free_memory():
+    try:
+        # windows
+        if os.name == "nt":
+            class MemoryStatus(ctypes.Structure):
+                _fields_ = [("dwLength", ctypes.c_ulong),
+                            ("dwMemoryLoad", ctypes.c_ulong),
+                            ("ullTotalPhys", ctypes.c_ulonglong),
+                            ("ullAvailPhys", ctypes.c_ulonglong),
+                            ("ullTotalPageFile", ctypes.c_ulonglong),
+                            ("ullAvailPageFile", ctypes.c_ulonglong),
+                            ("ullTotalVirtual", ctypes.c_ulonglong),
+                            ("ullAvailVirtual", ctypes.c_ulonglong),
+                            ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+
+            status = MemoryStatus()
+            status.dwLength = ctypes.sizeof(MemoryStatus)
+
+            ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status))
+
+            return status.ullAvailPhys // (1024 * 1024)
+
+        # linux
+        if os.path.exists("/proc/meminfo"):
+            with open("/proc/meminfo") as meminfo:
+                for line in meminfo:
+                    if line.startswith("MemAvailable:"):
+                        return int(line.split()[1]) // 1024
+
+        # other unix systems
+        return (os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")) // (1024 * 1024)
+
+    except (OSError, ValueError, AttributeError):
+        return None
+
+# returns [win, draw, loss] per mille from white's perspective for an info line
+def _get_wdl(info: dict):
+    if "wdl" in info:
+        wdl = info["wdl"].white()
+    elif "score" in info:
+        wdl = info["score"].white().wdl()
+    else:
+        return [0, 1000, 0]
+
+    return [wdl.wins, wdl.draws, wdl.losses]
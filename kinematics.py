@@ -0,0 +1,148 @@
+import subprocess
+
+try:
+    import numpy
+except:
+    subprocess.run(["pip", "install", "numpy"])
+    import numpy
+
+
+# inverse kinematics junk, source: https://github.com/aakieu/2-dof-planar/blob/master/python/inverse_kinematics.py
+# works on scalars or numpy arrays of coordinates
+def get_servo_angles(x, y, a1, a2):
+
+    # equations for Inverse kinematics
+    r1 = numpy.sqrt(x ** 2 + y ** 2)  # radius equation
+    phi_1 = -numpy.arccos((a2 ** 2 - a1 ** 2 - r1 ** 2) /
+                          (-2 * a1 * r1))  # eqauation 1
+    phi_2 = numpy.arctan2(y, -x)  # equation 2
+    phi_3 = -numpy.arccos((r1 ** 2 - a1 ** 2 - a2 ** 2) /
+                          (-2 * a1 * a2))  # equation 3
+
+    theta_1 = 180 - numpy.rad2deg(phi_2 - phi_1)
+
+    theta_2 = numpy.rad2deg(phi_3) + 180
+
+    return theta_1, theta_2
+
+# returns a boolean mask of the points inside the reach of the arm
+# points is an N×2 array of (x, y) coordinates
+def reachable(points, a1, a2):
+    points = numpy.asarray(points, dtype=float).reshape(-1, 2)
+
+    radius = numpy.hypot(points[:, 0], points[:, 1])
+
+    return (radius > abs(a1 - a2)) & (radius < (a1 + a2))
+
+# returns an N×2 array of (joint 1, joint 2) angles and a validity mask for an N×2 array of (x, y) points
+# angles of unreachable points are nan
+def solve(points, a1, a2):
+    points = numpy.asarray(points, dtype=float).reshape(-1, 2)
+
+    valid = reachable(points, a1, a2)
+
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        joint1, joint2 = get_servo_angles(points[:, 0], points[:, 1], a1, a2)
+
+    angles = numpy.column_stack((joint1, joint2))
+
+    valid &= ~numpy.isnan(angles).any(axis=1)
+    angles[~valid] = numpy.nan
+
+    return angles, valid
+
+# joint angles of every named board position, rebuilt only when the arm geometry or board positions change
+# names are squares ("e2"), "home" and the clear sequence ("clear-0", "clear-1", ...)
+class IKTable():
+
+    def __init__(self):
+        # settings the table was built from, a change to them marks the table stale until the next update
+        self.settings = None
+        self.stale = True
+        self._subscription = None
+
+        # row index of every name in the arrays below
+        self.index = {}
+
+        # N×2 arrays of (x, y) positions, (joint 1, joint 2) angles and the servo angles sent to the board
+        self.positions = numpy.zeros((0, 2))
+        self.angles = numpy.zeros((0, 2))
+        self.commands = numpy.zeros((0, 2))
+
+        # false for positions outside the reach of the arm
+        self.reachable = numpy.zeros(0, dtype=bool)
+
+    def _invalidate(self, changed: list):
+        self.stale = True
+
+    # rebuilds the table if the geometry or board positions changed since the last call
+    # settings that can be subscribed to, like settings_store.Settings, only rebuild it after they change
+    # a plain dictionary can't report changes, so it rebuilds the table every call
+    def update(self, settings: dict):
+        if settings is self.settings and not self.stale:
+            return self
+
+        if settings is not self.settings:
+            if self._subscription != None:
+                self.settings.unsubscribe(self._subscription)
+                self._subscription = None
+
+            self.settings = settings
+
+            if hasattr(settings, "subscribe"):
+                self._subscription = settings.subscribe(self._invalidate, keys=["hardware", "joint-offsets", "board-positions"])
+
+        # cleared before building, so a change made while building rebuilds the table again
+        self.stale = self._subscription == None
+
+        board_positions = settings["board-positions"]
+
+        names = []
+        positions = []
+
+        for row in range(1, 9):
+            for column in "abcdefgh":
+                names.append(f"{column}{row}")
+                positions.append(board_positions[str(row)][column])
+
+        names.append("home")
+        positions.append(board_positions["home"]["position"])
+
+        for index, position in enumerate(board_positions["clear"]["sequence"]):
+            names.append(f"clear-{index}")
+            positions.append(position)
+
+        positions = numpy.array(positions, dtype=float)
+
+        arm1 = settings["hardware"]["length-arm-1"]
+        arm2 = settings["hardware"]["length-arm-2"]
+
+        angles, valid = solve(positions, arm1, arm2)
+
+        self.index = {name: index for index, name in enumerate(names)}
+        self.positions = positions
+        self.angles = angles
+        self.commands = angles + [settings["joint-offsets"]["1"] - 90, settings["joint-offsets"]["2"]]
+        self.reachable = valid
+
+        return self
+
+    def __contains__(self, name: str):
+        return name in self.index
+
+    # returns the (x, y) position of a name
+    def position(self, name: str):
+        x, y = self.positions[self.index[name]]
+
+        return float(x), float(y)
+
+    # returns the (joint 1, joint 2) angles of a name, None if the arm can't reach it
+    def joint_angles(self, name: str):
+        index = self.index[name]
+
+        if not self.reachable[index]:
+            return None
+
+        joint1, joint2 = self.angles[index]
+
+        return float(joint1), float(joint2)
@@ -1,6 +1,7 @@
 import subprocess
-import json
 import chess_bot
+import session_manager
+from settings_store import settings
 import webbrowser
 import atexit
 import time
@@ -28,17 +29,15 @@ if platform.system() != "Windows":
     ptg.tim.print("[bold red]This program requires a windows machine to run...[/]")
     quit()
 
+chess_bot.configure_logging()
+
 # define window manager
 window_manager = ptg.WindowManager(framerate=20)
 
-# load settings file
-with open('settings.json') as json_file:
-    settings = json.load(json_file)
-
 # initialize communication with the chess robot
 ser = serial.Serial(timeout=2)
 
-serial_interface = chess_bot.SerialInterface(ser)
+serial_interface = chess_bot.RobotSession(ser)
 
 # create styles and macros
 def _create_aliases():
@@ -60,8 +59,8 @@ def _create_aliases():
     # define gui macros used in the status sidebar
     ptg.tim.define("!connection_status", lambda *_: get_connection_status())
     ptg.tim.define("!game_status", lambda *_: get_game_status())
-    ptg.tim.define("!game_visuals", lambda *_: chess_bot.get_board_visual())
-    ptg.tim.define("!game_wdl_stats", lambda *_: chess_bot.get_stats_visual())
+    ptg.tim.define("!game_visuals", lambda *_: serial_interface.get_board_visual())
+    ptg.tim.define("!game_wdl_stats", lambda *_: serial_interface.get_stats_visual())
 
 
 # set default styles for different widget types
@@ -142,6 +141,15 @@ def get_steps(slider: float):
     steps = round(2 ** ((slider.value * 10) - 3), 1)
     return steps
 
+# returns the serial-port setting for a comma separated list of ports, a single port is stored as a string
+def parse_serial_ports(text: str):
+    ports = [port.strip() for port in safe_str(text, "").split(",") if port.strip()]
+
+    if len(ports) > 1:
+        return ports
+
+    return ports[0] if ports else ""
+
 # returns a ui element indicating if the board is connected
 def get_connection_status():
 
@@ -189,7 +197,8 @@ def toggle_connection(state: str):
     
     if state == "Disconnect":
         try:
-            ser.port = settings["hardware"]["serial-port"]
+            # the gui drives the first robot, several robots are run by session_manager
+            ser.port = session_manager.serial_ports()[0]
             ser.baudrate = settings["hardware"]["baud-rate"]
 
             ser.open()
@@ -207,7 +216,7 @@ def toggle_connection(state: str):
             connect_toggle.toggle()
         
             # create an prompt notifying the user
-            menu_prompt(("[app.title]Error", "", "[app.label]Failed to connect to chess bot...", "", f"[app.label]Port: [/][app.text]{settings['hardware']['serial-port']}"), {"Edit": (lambda *_: navigate_menu("hardware_settings")), "Ok": None})
+            menu_prompt(("[app.title]Error", "", "[app.label]Failed to connect to chess bot...", "", f"[app.label]Port: [/][app.text]{session_manager.serial_ports()[0]}"), {"Edit": (lambda *_: navigate_menu("hardware_settings")), "Ok": None})
 
     else:
 
@@ -259,12 +268,12 @@ def end_game():
 
 def popout_board():
 
-    if chess_bot.board_popout_window.is_open:
+    if serial_interface.board_popout_window.is_open:
         menu_prompt(("[app.title]Can't Open Window", "", "[app.label]A board pop-out window,", "[app.label]already exists..."), {"Ok": None})
 
     else:
 
-        chess_bot.board_popout_window.show()
+        serial_interface.board_popout_window.show()
 
     
 # creates a custom alert menu
@@ -308,11 +317,12 @@ def menu_prompt(text: tuple, buttons: dict, _close=False, _function=None):
 
 # runs in a seperate thread, checks to see if chess_bot.py has prompts available and then displays it
 def get_prompts():
-    if not chess_bot.prompt_queue.empty():
-        try:
-            menu_prompt(*chess_bot.prompt_queue.get())
-        except:
-            menu_prompt(("[app.title]Error", "", "[app.label]Failed to create menu prompt..."), {"Ok": None})
+    for prompt_queue in (chess_bot.prompt_queue, serial_interface.prompt_queue):
+        if not prompt_queue.empty():
+            try:
+                menu_prompt(*prompt_queue.get())
+            except:
+                menu_prompt(("[app.title]Error", "", "[app.label]Failed to create menu prompt..."), {"Ok": None})
 
 # runs in a seperate thread, used by the gui to live update joint positions while editing
 prev_joint_offsets = {"hardware":{}}
@@ -323,18 +333,18 @@ def update_joint_offset(joint_num, value):
 
     merge_dicts(settings, joint_offsets)
 
-    # save settings to settings.json
-    with open("settings.json", "w") as json_file:
-        json_file.write(json.dumps(settings, indent=2))
+    # applied in memory right away, writes to settings.json are coalesced while the slider moves
+    settings.save()
 
-    serial_interface.goto_position(x=chess_bot.pos_x, y=chess_bot.pos_y, grabber="calibrate", retract=False)
+    serial_interface.goto_position(x=serial_interface.pos_x, y=serial_interface.pos_y, grabber="calibrate", retract=False)
 
-# runs in a separate thread, used to update the matrix on the sensor test page
-def update_sensor_matrix(matrix):
+# called from the serial reader thread with each streamed board change, used to update the matrix on the sensor test page
+def update_sensor_matrix(matrix, board=None):
     letter_columns = ["a", "b", "c", "d", "e", "f", "g", "h"]
 
     try:
-        board = serial_interface.get_board()
+        if board == None:
+            board = serial_interface.get_board()
 
         # iterate through the entire board dictionary
         for row in reversed(range(8)):
@@ -346,7 +356,7 @@ def update_sensor_matrix(matrix):
                         y = str((7 - row) * 3 + i)
                         x = str(column * 3 + j)
 
-                        if board[str(row + 1)][letter_columns[column]]:
+                        if board[f"{letter_columns[column]}{row + 1}"]:
                             matrix[(7 - row) * 3 + i, column * 3 + j] = "green"
                         else:
                             matrix[(7 - row) * 3 + i, column * 3 + j] = "red"
@@ -392,7 +402,7 @@ def compare_dicts(large_dict: dict, smaller_dict: dict):
 
 # creates an alert window prompting to save changes
 def save_prompt(command: object, save: dict, _dosave=None):
-    global save_alert, settings
+    global save_alert
 
     # check if a prompt needs to be created
     if (_dosave == None) and not compare_dicts(settings, save):
@@ -411,8 +421,7 @@ def save_prompt(command: object, save: dict, _dosave=None):
         merge_dicts(settings, save)
 
         # save settings to settings.json
-        with open("settings.json", "w") as json_file:
-            json_file.write(json.dumps(settings, indent=2))
+        settings.save()
 
         # close save prompt and navigate to specified window
         save_prompt(command, save, _dosave=False)
@@ -429,7 +438,7 @@ def save_prompt(command: object, save: dict, _dosave=None):
 
 # switches which menu page is displayed
 def navigate_menu(page: str, *args):
-    global menu, settings, joint_1_offset_slider, joint_2_offset_slider, joint_3_offset_slider, sensor_matrix_thread, brightness_slider
+    global menu, joint_1_offset_slider, joint_2_offset_slider, joint_3_offset_slider, sensor_matrix_subscription, brightness_slider
 
     # open new widow based on preset
     if page == "main":
@@ -566,8 +575,8 @@ def navigate_menu(page: str, *args):
 
     if page == "hardware_settings":
         serial_port_input = ptg.InputField(
-            value=str(settings["hardware"]["serial-port"]),
-            prompt="Serial Port: "
+            value=", ".join(session_manager.serial_ports()),
+            prompt="Serial Ports: "
         )
         
         baud_rate_input = ptg.InputField(
@@ -605,6 +614,26 @@ def navigate_menu(page: str, *args):
             prompt="Arm Retract Angle: "
         )
 
+        retraction_sweep_angle_input = ptg.InputField(
+            value=str(settings["hardware"]["retraction-sweep-angle"]),
+            prompt="Arm Sweep Angle: "
+        )
+
+        max_packet_rate_input = ptg.InputField(
+            value=str(settings["hardware"]["max-packet-rate"]),
+            prompt="Max Packet Rate (packets/sec): "
+        )
+
+        motion_mode_input = ptg.InputField(
+            value=str(settings["hardware"]["motion-mode"]),
+            prompt="Motion Mode (sequential/joint/cartesian): "
+        )
+
+        motion_sample_rate_input = ptg.InputField(
+            value=str(settings["hardware"]["motion-sample-rate"]),
+            prompt="Motion Sample Rate (Hz, max 20): "
+        )
+
         ports = ""
         for port, desc, hwid in sorted(serial.tools.list_ports.comports()):
             ports += f"\n[app.label]{port}:[/][app.text] {desc} [{hwid}]\n"
@@ -641,19 +670,31 @@ def navigate_menu(page: str, *args):
                 servo_speed_input,
                 "",
                 retraction_angle_input,
+                "",
+                retraction_sweep_angle_input,
+                "",
+                max_packet_rate_input,
+                "",
+                motion_mode_input,
+                "",
+                motion_sample_rate_input,
                 relative_width=0.6
             ),
             "",
             ["« Back", lambda *_: save_prompt(lambda *_: navigate_menu("settings"),
                                               save={"hardware": {
-                                                    "serial-port": safe_str(serial_port_input.value, ""),
+                                                    "serial-port": parse_serial_ports(serial_port_input.value),
                                                     "baud-rate": safe_int(baud_rate_input.value, 0),
                                                     "length-arm-1": safe_float(arm1_length_input.value, 2, 10),
                                                     "length-arm-2": safe_float(arm2_length_input.value, 2, 10),
                                                     "grabber-open-angle": safe_int(grabber_open_input.value, 90),
                                                     "grabber-closed-angle": safe_int(grabber_closed_input.value, 90),
                                                     "servo-speed-deg/sec": safe_int(servo_speed_input.value, 150),
-                                                    "retraction-angle": safe_int(retraction_angle_input.value, 130)
+                                                    "retraction-angle": safe_int(retraction_angle_input.value, 130),
+                                                    "retraction-sweep-angle": safe_int(retraction_sweep_angle_input.value, 80),
+                                                    "max-packet-rate": safe_int(max_packet_rate_input.value, 50),
+                                                    "motion-mode": safe_str(motion_mode_input.value, "joint"),
+                                                    "motion-sample-rate": safe_int(motion_sample_rate_input.value, 20)
                                                     }})],
             is_static=True,
             is_noresize=True,
@@ -777,8 +818,12 @@ def navigate_menu(page: str, *args):
         # create the text list of led effects
         effects = ""
         if ser.is_open:
-            for index in sorted(serial_interface.get_effects()):
-                effects += f"\n{index}\n"
+            # the list stays empty if the board doesn't answer
+            try:
+                for index in sorted(serial_interface.get_effects()):
+                    effects += f"\n{index}\n"
+            except TimeoutError:
+                pass
         
             if effects == "":
                 effects = "\nNone\n"
@@ -909,6 +954,14 @@ def navigate_menu(page: str, *args):
             prompt="Starting Fen: "
         )
 
+        ponder_toggle = ptg.Toggle(("Ponder: True", "Ponder: False"))
+        if not settings["game"]["ponder"]:
+            ponder_toggle.toggle()
+
+        ponder_move_count_slider = ptg.Slider()
+        ponder_move_count_slider.value = (settings["game"]["ponder-move-count"] / 10)
+        ptg.tim.define("!ponder_move_count", lambda *_: str(round(ponder_move_count_slider.value * 10)))
+
         new_menu = ptg.Window(
             "[app.title]Game Settings",
             "",
@@ -927,6 +980,14 @@ def navigate_menu(page: str, *args):
                 ),
                 top_move_count_slider,
                 "",
+                ponder_toggle,
+                "",
+                ptg.Splitter(
+                    ptg.Label("[app.label]Replies to Ponder:", parent_align=0),
+                    ptg.Label("[!ponder_move_count] [/!]",parent_align=2)
+                ),
+                ponder_move_count_slider,
+                "",
                 starting_fen_input,
                 "",
                 ["Paste Fen", lambda *_: starting_fen_input.insert_text(pyperclip.paste())],
@@ -941,7 +1002,9 @@ def navigate_menu(page: str, *args):
                                                         "countdown-duration": safe_float(countdown_duration_input.value, 1, 5),
                                                         "bot-elo": round(bot_elo_slider.value * 3000),
                                                         "starting-fen": safe_str(starting_fen_input.value, "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w"),
-                                                        "top-move-count": safe_int(top_move_count_slider.value * 10)
+                                                        "top-move-count": safe_int(top_move_count_slider.value * 10),
+                                                        "ponder": ponder_toggle.checked,
+                                                        "ponder-move-count": safe_int(ponder_move_count_slider.value * 10)
                                                   }
                                               })],
             is_static=True,
@@ -1043,10 +1106,10 @@ def navigate_menu(page: str, *args):
         # define macros used in this page
         ptg.tim.define("!steps_z", lambda *_: str(get_steps(z_step_slider)))
         ptg.tim.define("!steps_xy", lambda *_: str(get_steps(xy_step_slider)))
-        ptg.tim.define("!pos_x", lambda *_: str(round(chess_bot.pos_x, 1)))
-        ptg.tim.define("!pos_y", lambda *_: str(round(chess_bot.pos_y, 1)))
-        ptg.tim.define("!pos_z", lambda *_: str(round(chess_bot.pos_z, 1)))
-        ptg.tim.define("!grabber_state", lambda *_: chess_bot.grabber_state)
+        ptg.tim.define("!pos_x", lambda *_: str(round(serial_interface.pos_x, 1)))
+        ptg.tim.define("!pos_y", lambda *_: str(round(serial_interface.pos_y, 1)))
+        ptg.tim.define("!pos_z", lambda *_: str(round(serial_interface.pos_z, 1)))
+        ptg.tim.define("!grabber_state", lambda *_: serial_interface.grabber_state)
 
         new_menu = ptg.Window(
             "[app.title]Jog Machine",
@@ -1057,10 +1120,10 @@ def navigate_menu(page: str, *args):
                     ptg.Label("([!pos_x] [/!], [!pos_y] [/!]) mm",
                               parent_align=2)
                 ),
-                ptg.KeyboardButton("w ↑", lambda *_: serial_interface.goto_position(y=(chess_bot.pos_y + get_steps(xy_step_slider)), retract=False), bound="w"),
-                ptg.KeyboardButton("a ←", lambda *_: serial_interface.goto_position(x=(chess_bot.pos_x - get_steps(xy_step_slider)), retract=False), bound="a"),
-                ptg.KeyboardButton("s ↓", lambda *_: serial_interface.goto_position(y=(chess_bot.pos_y - get_steps(xy_step_slider)), retract=False), bound="s"),
-                ptg.KeyboardButton("d →", lambda *_: serial_interface.goto_position(x=(chess_bot.pos_x + get_steps(xy_step_slider)), retract=False), bound="d"),
+                ptg.KeyboardButton("w ↑", lambda *_: serial_interface.goto_position(y=(serial_interface.pos_y + get_steps(xy_step_slider)), retract=False), bound="w"),
+                ptg.KeyboardButton("a ←", lambda *_: serial_interface.goto_position(x=(serial_interface.pos_x - get_steps(xy_step_slider)), retract=False), bound="a"),
+                ptg.KeyboardButton("s ↓", lambda *_: serial_interface.goto_position(y=(serial_interface.pos_y - get_steps(xy_step_slider)), retract=False), bound="s"),
+                ptg.KeyboardButton("d →", lambda *_: serial_interface.goto_position(x=(serial_interface.pos_x + get_steps(xy_step_slider)), retract=False), bound="d"),
                 "",
                 ptg.Splitter(
                     ptg.Label("[app.label]Step:", parent_align=0),
@@ -1079,8 +1142,8 @@ def navigate_menu(page: str, *args):
                     ptg.Label("[app.label]Jog Z:", parent_align=0),
                     ptg.Label("[!pos_z] [/!] mm", parent_align=2)
                 ),
-                ptg.KeyboardButton("e Up", lambda *_: serial_interface.goto_position(z=(chess_bot.pos_z + get_steps(z_step_slider))), bound="e"),
-                ptg.KeyboardButton("q Down", lambda *_: serial_interface.goto_position(z=(chess_bot.pos_z - get_steps(z_step_slider))), bound="q"),
+                ptg.KeyboardButton("e Up", lambda *_: serial_interface.goto_position(z=(serial_interface.pos_z + get_steps(z_step_slider))), bound="e"),
+                ptg.KeyboardButton("q Down", lambda *_: serial_interface.goto_position(z=(serial_interface.pos_z - get_steps(z_step_slider))), bound="q"),
                 ptg.Button("Home", lambda *_: serial_interface.goto_position(z=0)),
                 "",
                 ptg.Splitter(
@@ -1143,8 +1206,9 @@ def navigate_menu(page: str, *args):
 
         matrix = ptg.PixelMatrix(24, 24, default="red")
 
-        sensor_matrix_thread = continuous_threading.PeriodicThread(0.1, lambda *_: update_sensor_matrix(matrix))
-        sensor_matrix_thread.start()
+        # draw the current readings, then redraw whenever the board reports a change
+        update_sensor_matrix(matrix)
+        sensor_matrix_subscription = serial_interface.subscribe_board(lambda board: update_sensor_matrix(matrix, board))
 
         new_menu = ptg.Window(
             "[app.title]Sensor Test",
@@ -1164,7 +1228,7 @@ def navigate_menu(page: str, *args):
 
     else:
         try:
-            sensor_matrix_thread.close()
+            serial_interface.unsubscribe_board(sensor_matrix_subscription)
         except:
             pass
 
@@ -1324,6 +1388,10 @@ def on_exit():
 
         ser.close()
 
+    # stop the engine process
+    if chess_bot.stockfish_ready:
+        chess_bot.engine_pool.quit()
+
 if __name__ == "__main__":
     atexit.register(on_exit)
     main()
@@ -0,0 +1,68 @@
+import subprocess
+
+try:
+    import chess
+except:
+    subprocess.run(["pip", "install", "chess"])
+    import chess
+
+
+# maps the sensor changes of every legal move in a position to the move, built once per position
+# changes are described by two bitmasks (same square numbering as occupancy.py):
+#   touched - every square that changed at some point while the move was made
+#   diff    - every square whose occupancy differs from the start of the move
+# a capture lifts the captured piece so its square is touched but ends up occupied again,
+# castling touches both the king and rook squares and en passant also clears the captured pawn's square
+class MoveIndex():
+
+    def __init__(self, board: chess.Board):
+        self.fen = board.fen()
+
+        # (touched, diff) -> list of legal moves, promotions share one entry
+        self.moves = {}
+
+        # every subset of the squares touched by a legal move, a move in progress stays inside one of these
+        self.partial = set()
+
+        # changes of a rook moved to its castling square, they match a legal rook move
+        # but are also the first half of castling when the rook is moved before the king
+        self.castling_prefixes = set()
+
+        start = board.occupied
+
+        for move in board.legal_moves:
+            board.push(move)
+            diff = start ^ board.occupied
+            board.pop()
+
+            touched = diff | chess.BB_SQUARES[move.from_square] | chess.BB_SQUARES[move.to_square]
+
+            self.moves.setdefault((touched, diff), []).append(move)
+
+            if board.is_castling(move):
+                rank = chess.square_rank(move.from_square)
+
+                if board.is_kingside_castling(move):
+                    rook = chess.BB_SQUARES[chess.square(7, rank)] | chess.BB_SQUARES[chess.square(5, rank)]
+                else:
+                    rook = chess.BB_SQUARES[chess.square(0, rank)] | chess.BB_SQUARES[chess.square(3, rank)]
+
+                self.castling_prefixes.add((rook, rook))
+
+            # enumerate the submasks of touched
+            subset = touched
+            while subset:
+                self.partial.add(subset)
+                subset = (subset - 1) & touched
+
+    # returns the legal moves matching the sensor changes, more than one if the move is a promotion
+    def lookup(self, touched: int, diff: int):
+        return self.moves.get((touched, diff), [])
+
+    # returns true if the changes match a rook move that could still become castling
+    def is_castling_prefix(self, touched: int, diff: int):
+        return (touched, diff) in self.castling_prefixes
+
+    # returns true if the changes could still become a legal move
+    def is_partial(self, touched: int):
+        return touched == 0 or touched in self.partial
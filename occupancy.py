@@ -0,0 +1,91 @@
+letter_columns = ["a", "b", "c", "d", "e", "f", "g", "h"]
+
+# every square on the board set
+FULL_BOARD = (1 << 64) - 1
+
+# returns the bit index of a square name, a1 is bit 0 and h8 is bit 63 (same numbering as python-chess)
+def square_index(square: str):
+    return (int(square[1]) - 1) * 8 + letter_columns.index(square[0])
+
+# returns the square name of a bit index
+def square_name(index: int):
+    return f"{letter_columns[index % 8]}{(index // 8) + 1}"
+
+# returns how many squares are set in a bitmask
+def popcount(mask: int):
+    return bin(mask).count("1")
+
+# returns the names of every square set in a bitmask, in ascending bit order
+def mask_squares(mask: int):
+    squares = []
+
+    while mask:
+        lowest = mask & -mask
+        squares.append(square_name(lowest.bit_length() - 1))
+        mask ^= lowest
+
+    return squares
+
+# hall sensor readings of the whole board packed into one 64 bit integer
+class Occupancy():
+
+    def __init__(self, bits: int=0):
+        self.bits = int(bits) & FULL_BOARD
+
+    # creates an occupancy from the hex string sent by the board
+    @classmethod
+    def from_hex(cls, text: str):
+        return cls(int(text, 16))
+
+    # creates an occupancy from the nested {"1": {"a": bool, ...}} board dictionary
+    @classmethod
+    def from_dict(cls, board: dict):
+        bits = 0
+
+        for row in board.keys():
+            for column in board[row].keys():
+                if board[row][column]:
+                    bits |= 1 << square_index(f"{column}{row}")
+
+        return cls(bits)
+
+    # returns true if a piece is on the square, example: occupancy["e2"]
+    def __getitem__(self, square: str):
+        return bool(self.bits >> square_index(square) & 1)
+
+    def __eq__(self, other):
+        return isinstance(other, Occupancy) and self.bits == other.bits
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def __repr__(self):
+        return f"Occupancy({self.hex()})"
+
+    # returns the occupancy as a 16 character hex string
+    def hex(self):
+        return f"{self.bits:016x}"
+
+    # returns how many squares have a piece on them
+    def count(self):
+        return popcount(self.bits)
+
+    # returns a bitmask of every square that differs between two occupancies
+    def diff(self, other):
+        return self.bits ^ other.bits
+
+    # returns a list of (square, occupied) for every square that changed going from this occupancy to the other
+    def changes(self, other):
+        return [(square, other[square]) for square in mask_squares(self.diff(other))]
+
+    # returns the occupancy as the nested {"1": {"a": bool, ...}} board dictionary
+    def to_dict(self):
+        board = {}
+
+        for row in range(8):
+            board[str(row + 1)] = {}
+
+            for column in letter_columns:
+                board[str(row + 1)][column] = self[f"{column}{row + 1}"]
+
+        return board
@@ -0,0 +1,49 @@
+import subprocess
+import random
+import os
+
+try:
+    import chess
+    import chess.polyglot
+except:
+    subprocess.run(["pip", "install", "chess"])
+    import chess
+    import chess.polyglot
+
+
+# polyglot .bin opening book, memory mapped and binary searched by python-chess
+class OpeningBook():
+
+    def __init__(self, path: str):
+        self.path = path
+        self.reader = chess.polyglot.open_reader(path)
+
+    # returns a book move for the position in uci form, None once the game has left the book
+    # weights are raised to elo / 1500, so strong bots mostly play the main lines and weak bots play them less often
+    def choose(self, board: chess.Board, elo: int=1500):
+        # zero weight entries are moves the book says never to play
+        entries = [entry for entry in self.reader.find_all(board) if entry.weight > 0]
+
+        if not entries:
+            return None
+
+        exponent = max(elo, 1) / 1500
+
+        weights = [entry.weight ** exponent for entry in entries]
+
+        return random.choices(entries, weights=weights)[0].move.uci()
+
+    def close(self):
+        self.reader.close()
+
+# returns an opening book for a path relative to the program folder, None if the path is empty or missing
+def load(path: str):
+    if not path:
+        return None
+
+    full_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path.lstrip("/"))
+
+    if not os.path.isfile(full_path):
+        return None
+
+    return OpeningBook(full_path)
@@ -12,6 +12,10 @@ duty_min = 1800
 duty_max = 8100
 max_degrees = 180
 
+# servo_speed is the default used to estimate where each servo is, the host can override it with "servo-speed"
+servo_speed = 150 # deg/sec
+servo_tolerance = 0.5 # ±degrees
+
 # z axis
 z_axis_speed = 58.2 # mm/s
 z_axis_tolerance = 2 # ±mm
@@ -21,6 +25,12 @@ z_axis_zero_position = 90
 strip_length1 = 8
 strip_length2 = 8
 
+# trajectories
+waypoint_timeout = 10000 # milliseconds, a waypoint that never reaches its target is skipped after this long
+
+# board sensors
+sensor_scan_period = 50 # milliseconds, how often the board is scanned while streaming
+
 # mainloop
 loop_delay = 50 # milliseconds
 # ---------- Config End ----------
@@ -31,6 +41,10 @@ data = {
   "angle-joint1": 90,
   "angle-joint2": 90,
   "angle-joint3": 90,
+  "servo-speed": servo_speed,
+
+  # when true the board is scanned every sensor_scan_period and changes are sent to the host unprompted
+  "stream-board": False,
 
   "leds": {
     "effect": "glow",
@@ -50,6 +64,35 @@ letter_columns = ["a", "b", "c", "d", "e", "f", "g", "h"]
 
 current_z_pos = 0
 
+# servos have no feedback, so their positions are estimated by moving toward the commanded angle at servo-speed
+servo_keys = ["angle-joint1", "angle-joint2", "angle-joint3"]
+estimated_angles = {}
+for key in servo_keys:
+  estimated_angles[key] = float(data[key])
+
+# motion waits requested by the host as (id, keys), motion-done is sent once every key has arrived
+motion_waiters = []
+
+# last occupancy sent to the host while streaming, -1 forces the next scan to be sent
+streamed_bits = -1
+last_scan_time = time.ticks_ms()
+
+# trajectory uploaded by the host as (id, waypoints), picked up by the mainloop
+pending_trajectory = None
+
+# trajectory being run by the mainloop
+trajectory = None
+trajectory_id = None
+waypoint_index = 0
+waypoint_start = 0
+
+# both threads scan sensors and write to the host, these keep them from interleaving
+sensor_lock = _thread.allocate_lock()
+write_lock = _thread.allocate_lock()
+
+# the serial thread hands motion_waiters and pending_trajectory to the mainloop, this guards both
+handoff_lock = _thread.allocate_lock()
+
 # servo pin setup
 z_axis_servo = machine.PWM(machine.Pin(0, machine.Pin.OUT))
 z_limit_switch = machine.Pin(4, machine.Pin.IN, machine.Pin.PULL_DOWN)
@@ -98,8 +141,135 @@ def merge_dicts(dict1: dict, dict2: dict):
 
   return dict1
 
+# reads every hall effect sensor, returns a 64 bit integer where bit 0 is a1 and bit 63 is h8
+def read_board_bits():
+  bits = 0
+
+  with sensor_lock:
+    for row_index in range(8):
+      # turn on sensor row
+      sensor["power"][row_index + 1].on()
+
+      for column_index in range(8):
+        # invert the data so a bit is set when a piece is on the square
+        if not sensor["data"][letter_columns[column_index]].value():
+          bits |= 1 << (row_index * 8 + column_index)
+
+      # we are done collecting sensor data, turn off row
+      sensor["power"][row_index + 1].off()
+
+  return bits
+
+# writes one json packet to the host
+def send_packet(packet: dict):
+  with write_lock:
+    sys.stdout.write(f"{json.dumps(packet)}\n")
+
+# returns true when the z axis has reached its target, a target of 0 is reached when the limit switch triggers
+def z_reached():
+  if float(data["position-z"]) == 0:
+    return z_limit_switch.value() == 0
+
+  return abs(current_z_pos - float(data["position-z"])) <= z_axis_tolerance
+
+# moves the estimated servo angles toward their commanded angles, called every mainloop iteration
+def update_estimated_angles():
+  step = float(data["servo-speed"]) * (loop_delay / 1000)
+
+  for key in servo_keys:
+    target = float(data[key])
+
+    if abs(target - estimated_angles[key]) <= step:
+      estimated_angles[key] = target
+    elif target > estimated_angles[key]:
+      estimated_angles[key] += step
+    else:
+      estimated_angles[key] -= step
+
+# returns true when every actuator in keys has reached its commanded position, all actuators if keys is None
+def motion_reached(keys=None):
+  if keys == None:
+    keys = servo_keys + ["position-z"]
+
+  for key in keys:
+    if key == "position-z":
+      if not z_reached():
+        return False
+
+    elif key in estimated_angles and abs(float(data[key]) - estimated_angles[key]) > servo_tolerance:
+      return False
+
+  return True
+
+# tells the host about every motion wait that has arrived
+def check_motion_waiters():
+  global motion_waiters
+
+  done = []
+  waiting = []
+
+  with handoff_lock:
+    for waiter in motion_waiters:
+      if motion_reached(waiter[1]):
+        done.append(waiter)
+      else:
+        waiting.append(waiter)
+
+    motion_waiters = waiting
+
+  for waiter in done:
+    send_packet({"event": "motion-done", "id": waiter[0]})
+
+# runs the active trajectory one waypoint at a time, called every mainloop iteration
+def step_trajectory():
+  global pending_trajectory, trajectory, trajectory_id, waypoint_index, waypoint_start
+
+  # start a newly uploaded trajectory, replacing the one being run
+  with handoff_lock:
+    uploaded = pending_trajectory
+    pending_trajectory = None
+
+  if uploaded != None:
+    trajectory_id, trajectory = uploaded
+
+    waypoint_index = 0
+    waypoint_start = time.ticks_ms()
+
+    if len(trajectory) > 0:
+      merge_dicts(data, trajectory[0]["data"])
+
+  if trajectory == None:
+    return
+
+  if waypoint_index < len(trajectory):
+    waypoint = trajectory[waypoint_index]
+    elapsed = time.ticks_diff(time.ticks_ms(), waypoint_start)
+
+    # a waypoint lasts at least its hold time, "until": "reached" also waits for the actuators to arrive
+    done = elapsed >= waypoint.get("hold", 0)
+
+    if waypoint.get("until") == "reached":
+      done = done and motion_reached(list(waypoint["data"].keys()))
+
+    if not done and elapsed < waypoint_timeout:
+      return
+
+    # move on to the next waypoint
+    waypoint_index += 1
+    waypoint_start = time.ticks_ms()
+
+    if waypoint_index < len(trajectory):
+      merge_dicts(data, trajectory[waypoint_index]["data"])
+      return
+
+  # every waypoint has been run, tell the host
+  send_packet({"event": "trajectory-done", "id": trajectory_id})
+  trajectory = None
+
 # ran as a seperate thread, takes in serial data and updates data dictionary
 def serial_communication_thread():
+  global pending_trajectory
+
   while True:
 
     # sent back to the host device based on data recieved
@@ -109,33 +279,52 @@ def serial_communication_thread():
     try:
       serial = json.loads(sys.stdin.readline().replace("\n", ""))
 
+      # echo the sequence id so the host can match this response to its request
+      if "id" in serial.keys():
+        response["id"] = serial["id"]
+
       # update data dictionary to push updates to servos
       if "data" in serial.keys():
         merge_dicts(data, serial["data"])
+
+      # motion-done is sent with the same id once the actuators have arrived
+      # "wait" is either true for every actuator or a list of data keys, such as ["angle-joint1", "position-z"]
+      if serial.get("wait"):
+        keys = None
+
+        if isinstance(serial["wait"], list):
+          keys = serial["wait"]
+
+        with handoff_lock:
+          motion_waiters.append((serial.get("id"), keys))
+
+      # hand a list of waypoints to the mainloop, trajectory-done is sent with the same id once it finishes
+      if "trajectory" in serial.keys():
+        with handoff_lock:
+          pending_trajectory = (serial.get("id"), serial["trajectory"])
       
       # return board sensor readings to the host
       if "return" in serial.keys():
       
         if serial["return"] == "board":
           
+          bits = read_board_bits()
+
           # create the board directory
           response["response"]["board"] = {}
 
           # rows
           for row_index in range(8):
-            # turn on sensor row
-            sensor["power"][row_index + 1].on()
-
             # create a row directory
             response["response"]["board"][str(row_index + 1)] = {}
 
-            # save sensor data
-            for column_index in letter_columns:
-              # invert the data so sensor reads true when a piece is on it
-              response["response"]["board"][str(row_index + 1)][str(column_index)] = not bool(sensor["data"][column_index].value())
+            # save sensor data, true when a piece is on the square
+            for column_index in range(8):
+              response["response"]["board"][str(row_index + 1)][letter_columns[column_index]] = bool(bits >> (row_index * 8 + column_index) & 1)
 
-            # we are done collecting sensor data, turn off row
-            sensor["power"][row_index + 1].off()
+        # same readings packed into a 16 character hex string
+        elif serial["return"] == "board-bits":
+          response["response"]["board-bits"] = "%016x" % read_board_bits()
 
         elif serial["return"] == "fx-list":
           response["response"]["fx-list"] = list(led_effects.fx_list.keys())
@@ -150,7 +339,7 @@ def serial_communication_thread():
 
 
     # send response to host
-    sys.stdout.write(f"{json.dumps(response)}\n")
+    send_packet(response)
 
 # start the serial communication handling thread
 _thread.start_new_thread(serial_communication_thread, ())
@@ -161,6 +350,26 @@ while True:
   # loop delay
   time.sleep(loop_delay / 1000)
 
+  # scan the board and tell the host when a piece is lifted or placed
+  if data["stream-board"]:
+    if time.ticks_diff(time.ticks_ms(), last_scan_time) >= sensor_scan_period:
+      last_scan_time = time.ticks_ms()
+
+      bits = read_board_bits()
+
+      if bits != streamed_bits:
+        streamed_bits = bits
+        send_packet({"event": "board-bits", "board-bits": "%016x" % bits})
+
+  else:
+    streamed_bits = -1
+
+  # track where the servos should be by now
+  update_estimated_angles()
+
+  # advance the trajectory uploaded by the host
+  step_trajectory()
+
   # set servo positions
   joint1_servo.duty_u16(get_pwm(data["angle-joint1"]))
   joint2_servo.duty_u16(get_pwm(data["angle-joint2"]))
@@ -186,6 +395,9 @@ while True:
   # target position is met, so stop moving
   else:
     z_axis_servo.duty_u16(get_pwm(z_axis_zero_position)) # stop
+
+  # report finished motion to the host
+  check_motion_waiters()
   
   # calculate the step size based on loop_delay and data["leds"]["speed"]
   step_size = (loop_delay / 1000) * ((int(data["leds"]["speed"]) % 256 + 1) / 255)
@@ -1,8 +1,8 @@
 import subprocess
-import json
 import random
 import threading
 import time
+from settings_store import settings
 
 try:
     import sounddevice as sd
@@ -21,9 +21,8 @@ def play_sound_file(file_path, volume):
 
 def play_json_sound(name, blocking:bool=False):
 
-    # load settings file
-    with open('settings.json') as json_file:
-        settings = json.load(json_file)
+    # pick up changes to the settings file
+    settings.reload()
 
     # check if sound exsists
     if name in settings["sounds"].keys():
@@ -0,0 +1,353 @@
+import json
+import itertools
+import re
+import socketserver
+import threading
+import time
+import chess_bot
+import session_manager
+from settings_store import settings
+
+
+# headless entry point, runs every robot in the settings with no terminal ui or board pop-out windows
+# clients talk json-rpc 2.0 over a local tcp socket, one json object per line like the robot's own serial protocol
+#
+# methods, robot is a serial port and defaults to the first robot:
+#   robots                          - list of robot names
+#   status(robot=None)              - status of one robot, every robot if robot is None
+#   start_game(robot), end_game(robot)
+#   jog(robot, dx, dy, dz, grabber) - moves the arm relative to its current position, every argument is optional
+#   goto(robot, x, y, z, grabber)   - moves the arm to an absolute position, every argument is optional
+#   set_leds(robot, macro)          - plays an led macro from the settings
+#   speak(robot, text)
+#   subscribe, unsubscribe          - turns status and prompt notifications on or off for the connection
+#   prompts(robot=None)             - prompts waiting for an answer, of one robot if robot isn't None
+#   answer_prompt(id, button, robot=None) - presses a button of a prompt, example: "Fixed" once the board is prepared
+#                                     robot is checked against the robot that asked when it's given
+#
+# notifications sent to subscribed connections:
+#   status - {"robot", ...status} whenever a robot's status changes
+#   prompt - {"id", "robot", "text", "buttons"} whenever a robot asks the user something
+#            robot is None for prompts that don't belong to a robot, like a missing engine binary
+
+
+class RPCError(Exception):
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+
+        self.code = code
+        self.message = message
+
+class Server():
+
+    def __init__(self, manager: session_manager.SessionManager):
+        self.manager = manager
+
+        # prompts waiting for an answer, keyed by id
+        self.prompts = {}
+        self._prompt_ids = itertools.count(1)
+
+        # connections receiving notifications
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+        self.methods = {"robots": self.robots,
+                        "status": self.status,
+                        "start_game": self.start_game,
+                        "end_game": self.end_game,
+                        "jog": self.jog,
+                        "goto": self.goto,
+                        "set_leds": self.set_leds,
+                        "speak": self.speak,
+                        "prompts": self.get_prompts,
+                        "answer_prompt": self.answer_prompt}
+
+    def robots(self):
+        return list(self.manager.sessions)
+
+    def status(self, robot: str=None):
+        if robot == None:
+            return {name: get_status(session) for name, session in list(self.manager.sessions.items())}
+
+        return get_status(self._session(robot))
+
+    def start_game(self, robot: str=None):
+        session = self._session(robot)
+
+        if not session.serial.is_open:
+            raise RPCError(-32000, "chess robot not connected")
+
+        self.manager.start_game(session.name)
+
+        return True
+
+    def end_game(self, robot: str=None):
+        self._session(robot).game_end(do_exit=False)
+
+        return True
+
+    def jog(self, robot: str=None, dx: float=0, dy: float=0, dz: float=0, grabber: str=None):
+        session = self._session(robot)
+
+        self._check_idle(session)
+
+        session.goto_position(x=(session.pos_x + dx) if dx else None,
+                              y=(session.pos_y + dy) if dy else None,
+                              z=(session.pos_z + dz) if dz else None,
+                              grabber=grabber, retract=False, suppress_errors=True)
+
+        return get_status(session)["position"]
+
+    def goto(self, robot: str=None, x: float=None, y: float=None, z: float=None, grabber: str=None):
+        session = self._session(robot)
+
+        self._check_idle(session)
+
+        session.goto_position(x=x, y=y, z=z, grabber=grabber, suppress_errors=True)
+
+        return get_status(session)["position"]
+
+    def set_leds(self, robot: str=None, macro: str=""):
+        if macro not in settings["led-strip"]["macros"]:
+            raise RPCError(-32602, f"unknown led macro {macro}")
+
+        self._session(robot).set_leds(macro, suppress_errors=True)
+
+        return True
+
+    def speak(self, robot: str=None, text: str=""):
+        self._session(robot).speak(text)
+
+        return True
+
+    def get_prompts(self, robot: str=None):
+        with self._lock:
+            return [prompt["message"] for prompt in self.prompts.values() if robot == None or prompt["message"]["robot"] == robot]
+
+    def answer_prompt(self, id: int, button: str, robot: str=None):
+        with self._lock:
+            prompt = self.prompts.get(id)
+
+            if prompt == None:
+                raise RPCError(-32602, f"no prompt with id {id}")
+
+            if robot != None and prompt["message"]["robot"] != robot:
+                raise RPCError(-32602, f"prompt {id} belongs to robot {prompt['message']['robot']}")
+
+            if button in prompt["buttons"]:
+                self.prompts.pop(id)
+
+        if button not in prompt["buttons"]:
+            raise RPCError(-32602, f"prompt {id} has no button {button}")
+
+        if prompt["buttons"][button] != None:
+            prompt["buttons"][button]()
+
+        return True
+
+    # returns a robot's session, the first robot if robot is None
+    def _session(self, robot: str=None):
+        sessions = self.manager.sessions
+
+        if robot == None and sessions:
+            return next(iter(sessions.values()))
+
+        if robot not in sessions:
+            raise RPCError(-32602, f"unknown robot {robot}")
+
+        return sessions[robot]
+
+    # the arm can't be jogged while a game is moving it
+    def _check_idle(self, session):
+        if session.game_state != "inactive":
+            raise RPCError(-32000, "a chess game is in progress")
+
+    # runs one request, returns the response or None for notifications
+    def handle(self, request: dict):
+        id = request.get("id") if isinstance(request, dict) else None
+
+        try:
+            if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+                raise RPCError(-32600, "invalid request")
+
+            if request["method"] not in self.methods:
+                raise RPCError(-32601, f"unknown method {request['method']}")
+
+            params = request.get("params", {})
+
+            if isinstance(params, list):
+                result = self.methods[request["method"]](*params)
+            else:
+                result = self.methods[request["method"]](**params)
+
+            response = {"jsonrpc": "2.0", "result": result, "id": id}
+
+        except RPCError as e:
+            response = {"jsonrpc": "2.0", "error": {"code": e.code, "message": e.message}, "id": id}
+
+        except TypeError as e:
+            response = {"jsonrpc": "2.0", "error": {"code": -32602, "message": str(e)}, "id": id}
+
+        except Exception as e:
+            response = {"jsonrpc": "2.0", "error": {"code": -32603, "message": str(e)}, "id": id}
+
+        if id == None:
+            return None
+
+        return response
+
+    def subscribe(self, connection):
+        with self._lock:
+            self._subscribers.add(connection)
+
+    def unsubscribe(self, connection):
+        with self._lock:
+            self._subscribers.discard(connection)
+
+    def notify(self, method: str, params: dict):
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for connection in subscribers:
+            connection.send({"jsonrpc": "2.0", "method": method, "params": params})
+
+    # turns the prompts waiting in a queue into notifications, robot is the name of the robot that asked
+    def _drain_prompts(self, prompt_queue, robot: str=None):
+        while not prompt_queue.empty():
+            text, buttons = prompt_queue.get()
+
+            id = next(self._prompt_ids)
+
+            message = {"id": id, "robot": robot, "text": " ".join(_strip_markup(line) for line in text if line).strip(), "buttons": list(buttons)}
+
+            with self._lock:
+                self.prompts[id] = {"message": message, "buttons": buttons}
+
+            self.notify("prompt", message)
+
+    # ran as a seperate thread, turns queued prompts into notifications and streams status changes
+    def _watch(self):
+        previous = {}
+
+        while True:
+            self._drain_prompts(chess_bot.prompt_queue)
+
+            for name, session in list(self.manager.sessions.items()):
+                self._drain_prompts(session.prompt_queue, name)
+
+            for name, session in list(self.manager.sessions.items()):
+                status = get_status(session)
+
+                if previous.get(name) != status:
+                    previous[name] = status
+
+                    self.notify("status", dict(status, robot=name))
+
+            time.sleep(settings["server"]["status-interval"])
+
+    # ran as a seperate thread, keeps checking every robot's connection like the gui does
+    def _check_connections(self):
+        while True:
+            self.manager.check_connections()
+
+            time.sleep(3)
+
+    def serve_forever(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+
+            def setup(self):
+                super().setup()
+
+                self._write_lock = threading.Lock()
+
+            def send(self, packet: dict):
+                try:
+                    with self._write_lock:
+                        self.wfile.write(f"{json.dumps(packet)}\n".encode())
+                        self.wfile.flush()
+                except OSError:
+                    server.unsubscribe(self)
+
+            # requests run on their own threads, a long speak or move doesn't hold up status requests
+            def run(self, request: dict):
+                if isinstance(request, dict) and request.get("method") == "subscribe":
+                    server.subscribe(self)
+                    response = {"jsonrpc": "2.0", "result": True, "id": request.get("id")}
+
+                elif isinstance(request, dict) and request.get("method") == "unsubscribe":
+                    server.unsubscribe(self)
+                    response = {"jsonrpc": "2.0", "result": True, "id": request.get("id")}
+
+                else:
+                    response = server.handle(request)
+
+                if response != None and response["id"] != None:
+                    self.send(response)
+
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+
+                    try:
+                        request = json.loads(line)
+                    except ValueError:
+                        self.send({"jsonrpc": "2.0", "error": {"code": -32700, "message": "parse error"}, "id": None})
+                        continue
+
+                    threading.Thread(target=self.run, args=(request,), daemon=True).start()
+
+                server.unsubscribe(self)
+
+        class TCPServer(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        threading.Thread(target=self._watch, daemon=True).start()
+        threading.Thread(target=self._check_connections, daemon=True).start()
+
+        with TCPServer((settings["server"]["host"], settings["server"]["port"]), Handler) as tcp_server:
+            tcp_server.serve_forever()
+
+# returns a json friendly status of a robot
+def get_status(session):
+    return {"connected": session.serial.is_open,
+            "game-state": session.game_state,
+            "position": {"x": round(session.pos_x, 1), "y": round(session.pos_y, 1), "z": round(session.pos_z, 1)},
+            "grabber": session.grabber_state,
+            "fen": session.game_board.fen(),
+            "wdl": list(session.wdl_stats)}
+
+# removes pytermgui markup from prompt text, example: "[app.title]Error" is "Error"
+def _strip_markup(text):
+    return re.sub(r"\[[^\]]*\]", "", str(text))
+
+def main():
+    chess_bot.configure_logging()
+
+    manager = session_manager.SessionManager(popout=False)
+
+    for port, error in manager.connect_all().items():
+        print(f"Failed to connect to chess bot on {port}: {error}")
+
+    server = Server(manager)
+
+    print(f"Serving {len(manager.sessions)} robot(s) on {settings['server']['host']}:{settings['server']['port']}")
+
+    try:
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        manager.disconnect_all()
+
+        if chess_bot.stockfish_ready:
+            chess_bot.engine_pool.quit()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import subprocess
+import threading
+import time
+import chess_bot
+from simulated_board import SimulatedBoard
+from settings_store import settings
+
+try:
+    import serial
+
+except:
+    subprocess.run(["pip", "install", "pyserial"])
+
+    import serial
+
+
+# returns the serial ports of every robot, hardware.serial-port is a single port or a list of them
+def serial_ports():
+    ports = settings["hardware"]["serial-port"]
+
+    if isinstance(ports, str):
+        return [ports]
+
+    return list(ports)
+
+# runs several robots from one process, one RobotSession per serial port
+# every session has its own game thread, the engine processes are shared through chess_bot.engine_pool
+class SessionManager():
+
+    # popout=False runs the robots without board pop-out windows, for headless hosts
+    def __init__(self, popout: bool=True):
+        self.popout = popout
+
+        # sessions keyed by their serial port
+        self.sessions = {}
+
+        self._game_threads = {}
+        self._lock = threading.Lock()
+
+        # held while a game is replaced, so two starts on one robot can't both start a game thread
+        self._start_lock = threading.Lock()
+
+    # opens a serial port and starts a session for it, returns the session
+    # ports named "sim", "sim-2", ... are simulated boards running simulation-speed times faster than real time
+    # raises serial.SerialException if the port can't be opened
+    def connect(self, port: str):
+        with self._lock:
+            if port in self.sessions:
+                return self.sessions[port]
+
+            if port.startswith("sim"):
+                ser = SimulatedBoard(time_scale=settings["hardware"]["simulation-speed"], port=port)
+
+            else:
+                ser = serial.Serial(timeout=2)
+                ser.port = port
+                ser.baudrate = settings["hardware"]["baud-rate"]
+
+                ser.open()
+
+                time.sleep(0.5)
+
+            session = chess_bot.RobotSession(ser, name=port, popout=self.popout)
+
+            self.sessions[port] = session
+
+        # push idle led animation to indicate connection success
+        session.set_leds("idle", suppress_errors=True)
+
+        return session
+
+    # connects every port in the settings, returns a dictionary of ports that failed and their errors
+    def connect_all(self):
+        failed = {}
+
+        for port in serial_ports():
+            try:
+                self.connect(port)
+            except Exception as e:
+                failed[port] = e
+
+        return failed
+
+    # ends the session's game and closes its serial port
+    def disconnect(self, port: str):
+        with self._lock:
+            session = self.sessions.pop(port, None)
+            thread = self._game_threads.pop(port, None)
+
+        if session == None:
+            return
+
+        session.set_leds("disconnected", suppress_errors=True)
+        session.close()
+
+        if thread != None:
+            thread.join()
+
+    def disconnect_all(self):
+        for port in list(self.sessions):
+            self.disconnect(port)
+
+    # starts a game on a robot, a running game is ended first
+    # the previous game thread is joined before the new one starts, it can still be finishing a trajectory
+    # and its game_end would otherwise stop the new game's sensor stream and searches
+    def start_game(self, port: str):
+        session = self.sessions[port]
+
+        with self._start_lock:
+            with self._lock:
+                previous = self._game_threads.get(port)
+
+            if session.game_state != "inactive":
+                session.game_end(do_exit=False)
+
+            if previous != None:
+                previous.join()
+
+            thread = threading.Thread(target=session.game_start, daemon=True)
+
+            with self._lock:
+                self._game_threads[port] = thread
+
+            thread.start()
+
+    def start_all(self):
+        for port in list(self.sessions):
+            self.start_game(port)
+
+    def end_game(self, port: str):
+        self.sessions[port].game_end(do_exit=False)
+
+    # checks the connection of every robot, ran periodically like the gui's connection checking thread
+    def check_connections(self):
+        for session in list(self.sessions.values()):
+            session.check_connection()
@@ -0,0 +1,170 @@
+import json
+import os
+import copy
+import threading
+import tempfile
+import atexit
+
+# settings.json shared by every module, behaves like the parsed dictionary
+# the file is only parsed again when its modification time or size changes
+# saves apply in memory at once and are written to disk at most once every save_delay seconds
+class Settings(dict):
+
+    def __init__(self, path: str, save_delay: float=0.5):
+        super().__init__()
+
+        self.path = path
+        self.save_delay = save_delay
+
+        # (mtime, size) of the file when it was last read or written
+        self._stat = None
+
+        # last contents read, written or saved, used to find which keys changed
+        self._snapshot = {}
+
+        # true while saved changes are waiting to be written, the file on disk is stale until then
+        self._dirty = False
+        self._save_timer = None
+
+        # callbacks called with a list of changed top level keys, keyed by the id of their subscription
+        self._subscribers = {}
+        self._lock = threading.RLock()
+
+        self.reload()
+
+        # don't lose a pending write when the program exits
+        atexit.register(self.flush)
+
+    # returns the (mtime, size) of the file, None if it can't be read
+    def _file_stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+
+        return (stat.st_mtime_ns, stat.st_size)
+
+    # re-reads the file if it changed on disk, returns a list of top level keys that changed
+    def reload(self):
+        # unwritten changes in memory are newer than the file
+        if self._dirty:
+            return []
+
+        stat = self._file_stat()
+
+        if stat == None or stat == self._stat:
+            return []
+
+        try:
+            with open(self.path) as json_file:
+                data = json.load(json_file)
+        except (OSError, ValueError):
+            # the file is probably mid write, try again on the next call
+            return []
+
+        with self._lock:
+            self._stat = stat
+
+            changed = [key for key in set(data) | set(self._snapshot) if data.get(key) != self._snapshot.get(key)]
+
+            # swap changed keys in place so every module holding this dictionary sees them
+            for key in changed:
+                if key in data:
+                    self[key] = data[key]
+                else:
+                    self.pop(key, None)
+
+            self._snapshot = copy.deepcopy(data)
+
+        self._notify(changed)
+
+        return changed
+
+    # marks the current settings to be written to the file, returns a list of top level keys that changed
+    # saves made within save_delay of each other are coalesced into one write
+    def save(self):
+        with self._lock:
+            data = copy.deepcopy(dict(self))
+
+            changed = [key for key in set(data) | set(self._snapshot) if data.get(key) != self._snapshot.get(key)]
+
+            self._snapshot = data
+            self._dirty = True
+
+            if self._save_timer == None:
+                self._save_timer = threading.Timer(self.save_delay, self.flush)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+        self._notify(changed)
+
+        return changed
+
+    # writes pending changes to the file now
+    # the file is written to a temporary file first and renamed over the original, so a crash can't truncate it
+    def flush(self):
+        with self._lock:
+            if self._save_timer != None:
+                self._save_timer.cancel()
+                self._save_timer = None
+
+            if not self._dirty:
+                return
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix=".settings-", suffix=".tmp")
+
+            try:
+                with os.fdopen(descriptor, "w") as json_file:
+                    json_file.write(json.dumps(self._snapshot, indent=2))
+                    json_file.flush()
+                    os.fsync(json_file.fileno())
+
+                # keep the permissions of the original file
+                if os.path.exists(self.path):
+                    os.chmod(temp_path, os.stat(self.path).st_mode)
+
+                os.replace(temp_path, self.path)
+
+            except:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+                raise
+
+            self._stat = self._file_stat()
+            self._dirty = False
+
+    # calls callback(changed_keys) whenever the settings change, optionally only for some top level keys
+    # returns a subscription that can be passed to unsubscribe
+    def subscribe(self, callback, keys: list=None):
+        subscription = (callback, set(keys) if keys != None else None)
+
+        with self._lock:
+            self._subscribers[id(subscription)] = subscription
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.pop(id(subscription), None)
+
+    def _notify(self, changed: list):
+        if not changed:
+            return
+
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+
+        for callback, keys in subscribers:
+            if keys == None or keys.intersection(changed):
+                try:
+                    callback(changed)
+                except:
+                    pass
+
+
+# process wide settings shared by every module
+settings = Settings("settings.json")
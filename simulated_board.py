@@ -0,0 +1,468 @@
+import subprocess
+import json
+import threading
+import time
+import kinematics
+from settings_store import settings
+
+try:
+    import chess
+    import numpy
+except:
+    subprocess.run(["pip", "install", "chess", "numpy"])
+    import chess
+    import numpy
+
+
+# same effects as led_tools.fx_list on the pico
+fx_list = ["rainbow", "blink", "glow", "fade", "chase", "gradient", "wld-stats"]
+
+# merges dictionaries without overwriting sub directories
+def merge_dicts(dict1: dict, dict2: dict):
+    for key, value in dict2.items():
+        if isinstance(value, dict) and key in dict1:
+            merge_dicts(dict1[key], value)
+        else:
+            dict1[key] = value
+
+    return dict1
+
+# stands in for the serial port of a pico running "pi pico w code/main.py", no hardware needed
+# speaks the same newline json protocol and runs the same mainloop on a simulated clock, time_scale times faster than real time
+# servos, the z axis and its limit switch, led effects and the hall effect sensors are simulated,
+# the grabber picks up and puts down pieces so games can be played against it
+#
+# the sensor matrix can be scripted, example: the player moving e2 to e4 a second after the robot's move
+#   board.schedule(1000, board.move, "e2", "e4")
+class SimulatedBoard():
+
+    # ---------- Config Start ----------
+    # same values as the pico's config
+    servo_speed = 150 # deg/sec
+    servo_tolerance = 0.5 # ±degrees
+
+    z_axis_speed = 58.2 # mm/s
+    z_axis_tolerance = 2 # ±mm
+
+    waypoint_timeout = 10000 # milliseconds
+    sensor_scan_period = 50 # milliseconds
+    loop_delay = 50 # milliseconds
+
+    # a joint this close to a board position's angles is over it, in degrees
+    position_tolerance = 2
+    # ---------- Config End ----------
+
+    # fen sets the pieces on the board, the starting position by default
+    def __init__(self, time_scale: float=10, fen: str=chess.STARTING_FEN, port: str="sim"):
+        self.time_scale = time_scale
+        self.port = port
+        self.baudrate = settings["hardware"]["baud-rate"]
+        self.timeout = 2
+        self.is_open = False
+
+        self.data = {
+            "position-z": 0,
+            "angle-joint1": 90,
+            "angle-joint2": 90,
+            "angle-joint3": 90,
+            "servo-speed": self.servo_speed,
+            "stream-board": False,
+            "leds": {
+                "effect": "glow",
+                "intensity": 150,
+                "speed": 100,
+                "brightness": 255,
+                "reversed": False,
+                "index": 0,
+                "pallet": {
+                    "1": [55, 0, 0],
+                    "2": [0, 0, 0]
+                }
+            }
+        }
+
+        # simulated milliseconds since the board started
+        self.ticks = 0
+
+        self.estimated_angles = {key: float(self.data[key]) for key in ["angle-joint1", "angle-joint2", "angle-joint3"]}
+        self.current_z_pos = 0
+
+        # occupancy of every square, bit 0 is a1 and bit 63 is h8
+        self.bits = chess.Board(fen).occupied
+
+        # square of the piece in the grabber, None if it's empty
+        self.holding = None
+        self.grabber_command = self.data["angle-joint3"]
+
+        # pieces dropped off the board, example: captured pieces
+        self.removed = []
+
+        # every led effect pushed to the board in order
+        self.led_history = []
+
+        self.motion_waiters = []
+        self.trajectory = None
+        self.trajectory_id = None
+        self.waypoint_index = 0
+        self.waypoint_start = 0
+
+        self.streamed_bits = -1
+        self.last_scan_time = 0
+
+        # (ticks, function, arguments) run by the mainloop once the clock reaches ticks
+        self.scheduled = []
+
+        # joint angles of every named board position, used to find what the grabber is over
+        self.ik_table = kinematics.IKTable()
+
+        self._outbound = b""
+        self._lock = threading.RLock()
+        self._readable = threading.Condition(self._lock)
+        self._thread = None
+
+        self.open()
+
+    def open(self):
+        with self._lock:
+            if self.is_open:
+                return
+
+            self.is_open = True
+
+            self._thread = threading.Thread(target=self._mainloop, daemon=True)
+            self._thread.start()
+
+    def close(self):
+        with self._lock:
+            self.is_open = False
+            self._readable.notify_all()
+
+    @property
+    def in_waiting(self):
+        return len(self._outbound)
+
+    # blocks until at least one byte arrives or the timeout passes, like a pyserial port
+    def read(self, size: int=1):
+        with self._readable:
+            if not self.is_open:
+                raise OSError("port not open")
+
+            if not self._outbound:
+                self._readable.wait(self.timeout)
+
+            data, self._outbound = self._outbound[:size], self._outbound[size:]
+
+        return data
+
+    # handles every complete line like the pico's serial communication thread
+    def write(self, data: bytes):
+        if not self.is_open:
+            raise OSError("port not open")
+
+        for line in data.decode().splitlines():
+            if line.strip():
+                self._handle_packet(line)
+
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        with self._lock:
+            self._outbound = b""
+
+    # ---------- sensor scripting ----------
+
+    # runs a function once delay simulated milliseconds have passed
+    def schedule(self, delay: float, function, *arguments):
+        with self._lock:
+            self.scheduled.append((self.ticks + delay, function, arguments))
+
+    # runs a list of (delay, function, arguments...) steps one after the other, each delay counts from the previous step
+    def script(self, steps: list):
+        delay = 0
+
+        for step in steps:
+            delay += step[0]
+            self.schedule(delay, step[1], *step[2:])
+
+    def set_square(self, square: str, occupied: bool):
+        with self._lock:
+            if occupied:
+                self.bits |= chess.BB_SQUARES[chess.parse_square(square)]
+            else:
+                self.bits &= ~chess.BB_SQUARES[chess.parse_square(square)]
+
+    def lift(self, square: str):
+        self.set_square(square, False)
+
+    def place(self, square: str):
+        self.set_square(square, True)
+
+    # a piece moved by hand, captures simply lift the captured piece first
+    def move(self, from_square: str, to_square: str):
+        self.lift(from_square)
+        self.place(to_square)
+
+    # sets the occupancy of every square from a fen
+    def set_board(self, fen: str):
+        with self._lock:
+            self.bits = chess.Board(fen).occupied
+
+    # ---------- protocol ----------
+
+    def _send(self, packet: dict):
+        with self._readable:
+            self._outbound += f"{json.dumps(packet)}\n".encode()
+            self._readable.notify_all()
+
+    def _handle_packet(self, line: str):
+        response = {"response": {}}
+
+        with self._lock:
+            try:
+                packet = json.loads(line)
+
+                if "id" in packet:
+                    response["id"] = packet["id"]
+
+                if "data" in packet:
+                    merge_dicts(self.data, packet["data"])
+
+                    if "leds" in packet["data"]:
+                        self.led_history.append(self.data["leds"]["effect"])
+
+                if packet.get("wait"):
+                    self.motion_waiters.append((packet.get("id"), packet["wait"] if isinstance(packet["wait"], list) else None))
+
+                if "trajectory" in packet:
+                    self._start_trajectory(packet.get("id"), packet["trajectory"])
+
+                if "return" in packet:
+                    if packet["return"] == "board":
+                        response["response"]["board"] = {str(row + 1): {column: bool(self.bits >> (row * 8 + index) & 1)
+                                                                        for index, column in enumerate("abcdefgh")}
+                                                         for row in range(8)}
+
+                    elif packet["return"] == "board-bits":
+                        response["response"]["board-bits"] = "%016x" % self.bits
+
+                    elif packet["return"] == "fx-list":
+                        response["response"]["fx-list"] = list(fx_list)
+
+                else:
+                    response["response"] = "ok"
+
+            except Exception as e:
+                response["response"] = str(e)
+
+        self._send(response)
+
+    # ---------- mainloop ----------
+
+    def _mainloop(self):
+        while self.is_open:
+            time.sleep((self.loop_delay / 1000) / self.time_scale)
+
+            with self._lock:
+                self.step()
+
+    # advances the simulation by one mainloop iteration of the pico
+    def step(self):
+        self.ticks += self.loop_delay
+
+        # run scripted sensor changes that are due
+        due = [item for item in self.scheduled if item[0] <= self.ticks]
+        self.scheduled = [item for item in self.scheduled if item[0] > self.ticks]
+
+        for _, function, arguments in sorted(due, key=lambda item: item[0]):
+            function(*arguments)
+
+        # scan the board and tell the host when a piece is lifted or placed
+        if self.data["stream-board"]:
+            if self.ticks - self.last_scan_time >= self.sensor_scan_period:
+                self.last_scan_time = self.ticks
+
+                if self.bits != self.streamed_bits:
+                    self.streamed_bits = self.bits
+                    self._send({"event": "board-bits", "board-bits": "%016x" % self.bits})
+
+        else:
+            self.streamed_bits = -1
+
+        self._update_estimated_angles()
+
+        self._step_trajectory()
+
+        # the grabber acts on the command, so pieces are gripped before the z axis starts moving
+        if self.data["angle-joint3"] != self.grabber_command:
+            self.grabber_command = self.data["angle-joint3"]
+            self._update_grabber()
+
+        self._update_z_axis()
+
+        self._check_motion_waiters()
+
+        # iterate the led effect index
+        self.data["leds"]["index"] += (self.loop_delay / 1000) * ((int(self.data["leds"]["speed"]) % 256 + 1) / 255)
+
+    def _update_estimated_angles(self):
+        step = float(self.data["servo-speed"]) * (self.loop_delay / 1000)
+
+        for key, angle in self.estimated_angles.items():
+            target = float(self.data[key])
+
+            if abs(target - angle) <= step:
+                self.estimated_angles[key] = target
+            elif target > angle:
+                self.estimated_angles[key] += step
+            else:
+                self.estimated_angles[key] -= step
+
+    # the limit switch is triggered once the z axis is all the way down
+    @property
+    def limit_switch(self):
+        return self.current_z_pos <= 0
+
+    def _z_reached(self):
+        if float(self.data["position-z"]) == 0:
+            return self.limit_switch
+
+        return abs(self.current_z_pos - float(self.data["position-z"])) <= self.z_axis_tolerance
+
+    def _update_z_axis(self):
+        target = float(self.data["position-z"])
+        step = self.z_axis_speed * (self.loop_delay / 1000)
+
+        if self.current_z_pos < (target - self.z_axis_tolerance) and target != 0:
+            self.current_z_pos += step
+
+        elif (self.current_z_pos > (target + self.z_axis_tolerance)) or (target == 0 and not self.limit_switch):
+            self.current_z_pos = max(0, self.current_z_pos - step)
+
+    def _motion_reached(self, keys=None):
+        if keys == None:
+            keys = list(self.estimated_angles) + ["position-z"]
+
+        for key in keys:
+            if key == "position-z":
+                if not self._z_reached():
+                    return False
+
+            elif key in self.estimated_angles and abs(float(self.data[key]) - self.estimated_angles[key]) > self.servo_tolerance:
+                return False
+
+        return True
+
+    def _check_motion_waiters(self):
+        waiting = []
+
+        for waiter in self.motion_waiters:
+            if self._motion_reached(waiter[1]):
+                self._send({"event": "motion-done", "id": waiter[0]})
+            else:
+                waiting.append(waiter)
+
+        self.motion_waiters = waiting
+
+    def _start_trajectory(self, id, waypoints: list):
+        self.trajectory_id = id
+        self.trajectory = waypoints
+        self.waypoint_index = 0
+        self.waypoint_start = self.ticks
+
+        if waypoints:
+            merge_dicts(self.data, waypoints[0]["data"])
+
+    def _step_trajectory(self):
+        if self.trajectory == None:
+            return
+
+        if self.waypoint_index < len(self.trajectory):
+            waypoint = self.trajectory[self.waypoint_index]
+            elapsed = self.ticks - self.waypoint_start
+
+            done = elapsed >= waypoint.get("hold", 0)
+
+            if waypoint.get("until") == "reached":
+                done = done and self._motion_reached(list(waypoint["data"].keys()))
+
+            if not done and elapsed < self.waypoint_timeout:
+                return
+
+            self.waypoint_index += 1
+            self.waypoint_start = self.ticks
+
+            if self.waypoint_index < len(self.trajectory):
+                merge_dicts(self.data, self.trajectory[self.waypoint_index]["data"])
+                return
+
+        self._send({"event": "trajectory-done", "id": self.trajectory_id})
+        self.trajectory = None
+
+    # returns the board position the arm is over, None if it isn't over one
+    def _arm_position(self):
+        self.ik_table.update(settings)
+
+        joints = numpy.array([self.estimated_angles["angle-joint1"], self.estimated_angles["angle-joint2"]])
+
+        distance = numpy.abs(self.ik_table.commands - joints).max(axis=1)
+        distance[~self.ik_table.reachable] = numpy.inf
+
+        if distance.size == 0 or distance.min() > self.position_tolerance:
+            return None
+
+        index = int(distance.argmin())
+
+        return next(name for name, row in self.ik_table.index.items() if row == index)
+
+    # closing the grabber at the bottom of the z axis picks up the piece below it,
+    # opening it puts the piece down on the square below or drops it off the board
+    def _update_grabber(self):
+        closed = settings["hardware"]["grabber-closed-angle"] + settings["joint-offsets"]["3"]
+        is_closed = abs(float(self.data["angle-joint3"]) - closed) <= self.servo_tolerance
+
+        position = self._arm_position()
+        square = position if position != None and position in chess.SQUARE_NAMES else None
+
+        if is_closed and self.holding == None and self.limit_switch and square != None:
+            if self.bits & chess.BB_SQUARES[chess.parse_square(square)]:
+                self.holding = square
+                self.lift(square)
+
+        elif not is_closed and self.holding != None:
+            if square != None:
+                self.place(square)
+            else:
+                self.removed.append(self.holding)
+
+            self.holding = None
+
+# plays the robot's moves against the simulated board and reports how long they took
+def main():
+    import chess_bot
+
+    board = SimulatedBoard(time_scale=50)
+    robot = chess_bot.RobotSession(board, name="sim", popout=False)
+
+    moves = ["e2e4", "d2d4", "g1f3", "b1c3"]
+
+    start_time = time.time()
+    start_ticks = board.ticks
+
+    for move in moves:
+        robot.make_move(move)
+
+    real = time.time() - start_time
+    simulated = (board.ticks - start_ticks) / 1000
+
+    print(f"{len(moves)} moves in {simulated:.1f} simulated seconds, {real:.1f} real seconds")
+
+    robot.close()
+
+    if chess_bot.stockfish_ready:
+        chess_bot.engine_pool.quit()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import subprocess
+import collections
+import threading
+import os
+
+try:
+    import chess
+    import chess.syzygy
+except:
+    subprocess.run(["pip", "install", "chess"])
+    import chess
+    import chess.syzygy
+
+
+# local syzygy endgame tablebases, gives exact results for positions with few enough pieces
+class Tablebase():
+
+    def __init__(self, path: str, cache_size: int=4096):
+        self.path = path
+        self.tablebase = chess.syzygy.open_tablebase(path)
+
+        # most pieces covered by the tables found in the folder
+        self.max_pieces = max([table_pieces(name) for name in os.listdir(path) if name.endswith(".rtbw")] + [0])
+
+        # probe results keyed by fen, oldest entries are dropped first
+        self.cache = collections.OrderedDict()
+        self.cache_size = cache_size
+
+        self._lock = threading.Lock()
+
+    # returns a result in the same form as Engine.analyse, None if the position isn't in the tables
+    #   best-move - move keeping the best result, winning fastest or losing slowest
+    #   top-moves - every legal move ranked the same way
+    #   wdl       - [win, draw, loss] per mille from white's perspective, exact
+    def probe(self, board: chess.Board, top_move_count: int=1):
+        if chess.popcount(board.occupied) > self.max_pieces or board.castling_rights:
+            return None
+
+        fen = board.fen()
+
+        with self._lock:
+            if fen in self.cache:
+                self.cache.move_to_end(fen)
+
+                result = self.cache[fen]
+
+            else:
+                result = self._probe(board)
+
+                self.cache[fen] = result
+
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+
+        if result == None:
+            return None
+
+        return {"best-move": result["best-move"],
+                "top-moves": result["top-moves"][:top_move_count],
+                "wdl": result["wdl"]}
+
+    def _probe(self, board: chess.Board):
+        try:
+            wdl = self.tablebase.probe_wdl(board)
+
+            ranked = []
+
+            for move in board.legal_moves:
+                board.push(move)
+
+                try:
+                    # results after the move are from the opponent's side, moves are sorted by (-wdl, dtz) in descending order
+                    # the worst wdl for them comes first, ties go to their highest dtz, a losing dtz closest to zero
+                    ranked.append(((-self.tablebase.probe_wdl(board), self.tablebase.probe_dtz(board)), move.uci()))
+                finally:
+                    board.pop()
+
+        except (KeyError, chess.syzygy.MissingTableError):
+            return None
+
+        ranked.sort(key=lambda item: item[0], reverse=True)
+
+        # cursed wins and blessed losses are draws under the 50 move rule
+        if wdl > 1:
+            stats = [1000, 0, 0]
+        elif wdl < -1:
+            stats = [0, 0, 1000]
+        else:
+            stats = [0, 1000, 0]
+
+        if board.turn == chess.BLACK:
+            stats.reverse()
+
+        return {"best-move": ranked[0][1] if ranked else None,
+                "top-moves": [move for _, move in ranked],
+                "wdl": stats}
+
+    def close(self):
+        self.tablebase.close()
+
+# returns how many pieces a table covers from its file name, example: KRvK.rtbw is 3
+def table_pieces(name: str):
+    return len(name.split(".")[0].replace("v", ""))
+
+# returns tablebases for a folder relative to the program folder, None if the path is empty or missing
+def load(path: str):
+    if not path:
+        return None
+
+    full_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path.lstrip("/"))
+
+    if not os.path.isdir(full_path):
+        return None
+
+    return Tablebase(full_path)